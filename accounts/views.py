@@ -4,7 +4,8 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegistrationForm, UserProfileForm
 from .models import UserProfile
-from games.models import GameSession, Leaderboard
+from games.models import GameSession
+from games.leaderboard import leaderboard_service
 
 
 def register(request):
@@ -36,8 +37,7 @@ def dashboard(request):
     total_games = GameSession.objects.filter(user=user, completed=True).count()
     
     # Get leaderboard position
-    leaderboard_entry = Leaderboard.objects.filter(user=user).first()
-    rank = leaderboard_entry.rank if leaderboard_entry else None
+    rank = leaderboard_service.rank_of(user)
     
     context = {
         'user': user,
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatRoom, ChatMessage, ConsultationRequest, OnlineChatSession, OnlineChatMessage, AdminOnlineStatus
+from .models import ChatRoom, ChatMessage, ConsultationRequest, OnlineChatSession, OnlineChatMessage, AdminOnlineStatus, OnlineChatArchive
 
 
 @admin.register(ChatRoom)
@@ -58,3 +58,18 @@ class AdminOnlineStatusAdmin(admin.ModelAdmin):
     list_editable = ['is_online']
     search_fields = ['admin__username']
 
+
+@admin.register(OnlineChatArchive)
+class OnlineChatArchiveAdmin(admin.ModelAdmin):
+    list_display = ['session_id', 'user', 'name', 'email', 'message_count', 'last_activity', 'archived_at']
+    list_filter = ['archived_at']
+    search_fields = ['session_id', 'name', 'email', 'user__username']
+    readonly_fields = ['session_id', 'user', 'name', 'email', 'message_count', 'started_at', 'last_activity', 'archived_at', 'transcript_preview']
+    exclude = ['transcript']
+    
+    def transcript_preview(self, obj):
+        return '\n'.join(f"[{msg['created_at']}] {msg['sender_type']}: {msg['message']}" for msg in obj.get_messages())
+    transcript_preview.short_description = 'Transcript'
+    
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,73 @@
+"""
+Management command to expire idle online chat sessions and archive old ones.
+
+Meant to be run periodically (e.g. from cron) to keep OnlineChatSession and
+OnlineChatMessage small.
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from chat.models import OnlineChatSession, OnlineChatMessage, OnlineChatArchive
+
+
+class Command(BaseCommand):
+    help = 'Deactivates idle online chat sessions and moves old ones into compressed archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-hours', type=float, default=24,
+                            help='Deactivate active sessions idle for longer than this (default: 24)')
+        parser.add_argument('--archive-days', type=float, default=30,
+                            help='Archive inactive sessions idle for longer than this (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Sessions archived per transaction (default: 200)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        idle_cutoff = now - timedelta(hours=options['idle_hours'])
+        deactivated = OnlineChatSession.objects.filter(
+            is_active=True, last_activity__lt=idle_cutoff
+        ).update(is_active=False, changed_at=now)
+        self.stdout.write(self.style.SUCCESS(f'[OK] {deactivated} idle sessions deactivated'))
+
+        archive_cutoff = now - timedelta(days=options['archive_days'])
+        archived = 0
+        while True:
+            batch = list(OnlineChatSession.objects.filter(
+                is_active=False, last_activity__lt=archive_cutoff
+            ).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            self.archive_batch(batch)
+            archived += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'[OK] {archived} sessions archived'))
+
+    def archive_batch(self, sessions):
+        """Store each session's messages as one compressed archive row, then delete the originals"""
+        session_ids = [session.pk for session in sessions]
+        transcripts = {pk: [] for pk in session_ids}
+        messages = OnlineChatMessage.objects.filter(session_id__in=session_ids).order_by('id').values(
+            'session_id', 'sender_type', 'sender_id', 'message', 'is_read', 'created_at'
+        )
+        for message in messages:
+            transcripts[message.pop('session_id')].append(
+                dict(message, created_at=message['created_at'].isoformat())
+            )
+
+        archives = [OnlineChatArchive(
+            session_id=session.session_id,
+            user_id=session.user_id,
+            name=session.name,
+            email=session.email,
+            message_count=len(transcripts[session.pk]),
+            transcript=OnlineChatArchive.compress_messages(transcripts[session.pk]),
+            started_at=session.created_at,
+            last_activity=session.last_activity,
+        ) for session in sessions]
+
+        with transaction.atomic():
+            OnlineChatArchive.objects.bulk_create(archives)
+            OnlineChatMessage.objects.filter(session_id__in=session_ids).delete()
+            OnlineChatSession.objects.filter(pk__in=session_ids).delete()
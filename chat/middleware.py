@@ -1,5 +1,4 @@
-from django.utils import timezone
-from .models import AdminOnlineStatus
+from .presence import record_heartbeat
 
 
 class AdminOnlineStatusMiddleware:
@@ -9,14 +8,10 @@ class AdminOnlineStatusMiddleware:
         self.get_response = get_response
     
     def __call__(self, request):
-        # Update admin online status if user is staff
+        # Record a presence heartbeat if user is staff (throttled, see chat.presence)
         if request.user.is_authenticated and request.user.is_staff:
-            admin_status, created = AdminOnlineStatus.objects.get_or_create(admin=request.user)
-            admin_status.is_online = True
-            admin_status.last_seen = timezone.now()
-            admin_status.save()
+            record_heartbeat(request.user)
         
         response = self.get_response(request)
         return response
 
-
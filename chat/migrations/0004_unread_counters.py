@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def unread_subquery(queryset, group_field):
+    counts = queryset.order_by().values(group_field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def backfill_unread_counts(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    OnlineChatSession = apps.get_model('chat', 'OnlineChatSession')
+    OnlineChatMessage = apps.get_model('chat', 'OnlineChatMessage')
+
+    unread = ChatMessage.objects.filter(room=OuterRef('pk'), is_read=False)
+    ChatRoom.objects.update(
+        lawyer_unread_count=unread_subquery(unread.filter(sender=OuterRef('user')), 'room'),
+        user_unread_count=unread_subquery(unread.exclude(sender=OuterRef('user')), 'room'),
+    )
+    OnlineChatSession.objects.update(
+        unread_count=unread_subquery(
+            OnlineChatMessage.objects.filter(session=OuterRef('pk'), sender_type='user', is_read=False),
+            'session',
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chatmessage_room_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='lawyer_unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Messages from the user the lawyer has not read'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user_unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Messages from the lawyer the user has not read'),
+        ),
+        migrations.AddField(
+            model_name='onlinechatsession',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Visitor messages not yet read by staff'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onlinechatsession',
+            index=models.Index(fields=['is_active', 'last_activity'], name='chat_session_active_idx'),
+        ),
+    ]
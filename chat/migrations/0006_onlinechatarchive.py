@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0005_onlinechatsession_active_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OnlineChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('transcript', models.BinaryField(help_text='zlib-compressed JSON list of the session messages')),
+                ('started_at', models.DateTimeField()),
+                ('last_activity', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_chat_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+    ]
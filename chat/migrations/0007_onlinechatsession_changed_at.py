@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_onlinechatarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onlinechatsession',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, help_text='Last change shown in the staff sessions list (activity, unread count, status)'),
+        ),
+        migrations.AddIndex(
+            model_name='onlinechatsession',
+            index=models.Index(fields=['changed_at'], name='chat_session_changed_idx'),
+        ),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+import json
+import zlib
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateformat import format as date_format
 
 User = get_user_model()
 
@@ -12,6 +18,8 @@ class ChatRoom(models.Model):
                               related_name='assigned_chats', limit_choices_to={'account_type': 'professional'})
     subject = models.CharField(max_length=200)
     is_active = models.BooleanField(default=True)
+    user_unread_count = models.PositiveIntegerField(default=0, help_text='Messages from the lawyer the user has not read')
+    lawyer_unread_count = models.PositiveIntegerField(default=0, help_text='Messages from the user the lawyer has not read')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -20,6 +28,23 @@ class ChatRoom(models.Model):
     
     def __str__(self):
         return f"{self.subject} - {self.user.username}"
+    
+    def unread_counter_for(self, reader):
+        """Name of the unread counter field for the room's client or lawyer"""
+        return 'user_unread_count' if reader.pk == self.user_id else 'lawyer_unread_count'
+    
+    def unread_count_for(self, reader):
+        return getattr(self, self.unread_counter_for(reader))
+    
+    def mark_read(self, reader):
+        """Mark messages sent to ``reader`` as read and take them off their unread counter"""
+        counter = self.unread_counter_for(reader)
+        with transaction.atomic():
+            updated = self.messages.filter(is_read=False).exclude(sender=reader).update(is_read=True)
+            # Only uncount what was marked read; a message sent meanwhile stays unread and counted
+            ChatRoom.objects.filter(pk=self.pk).update(**{counter: Greatest(F(counter) - updated, 0)})
+        setattr(self, counter, max(getattr(self, counter) - updated, 0))
+        return updated
 
 
 class ChatMessage(models.Model):
@@ -32,9 +57,22 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['room', 'created_at'], name='chat_msg_room_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.message[:50]}"
+    
+    def serialize(self):
+        """JSON-ready representation used by the room APIs and the pub/sub layer"""
+        return {
+            'id': self.pk,
+            'sender_id': self.sender_id,
+            'sender': self.sender.username,
+            'message': self.message,
+            'created_at': date_format(timezone.localtime(self.created_at), 'M d, H:i'),
+        }
 
 
 class ConsultationRequest(models.Model):
@@ -70,16 +108,46 @@ class OnlineChatSession(models.Model):
     email = models.EmailField(blank=True)
     is_active = models.BooleanField(default=True)
     is_admin_online = models.BooleanField(default=False)
+    unread_count = models.PositiveIntegerField(default=0, help_text='Visitor messages not yet read by staff')
     last_activity = models.DateTimeField(auto_now=True)
+    changed_at = models.DateTimeField(auto_now=True, help_text='Last change shown in the staff sessions list (activity, unread count, status)')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-last_activity']
+        indexes = [
+            models.Index(fields=['is_active', 'last_activity'], name='chat_session_active_idx'),
+            models.Index(fields=['changed_at'], name='chat_session_changed_idx'),
+        ]
     
     def __str__(self):
         if self.user:
             return f"Chat: {self.user.username}"
         return f"Chat: {self.session_id}"
+    
+    def update_contact(self, name='', email=''):
+        """Save name/email, but only the fields that actually changed"""
+        update_fields = []
+        if name and name != self.name:
+            self.name = name
+            update_fields.append('name')
+        if email and email != self.email:
+            self.email = email
+            update_fields.append('email')
+        if update_fields:
+            self.save(update_fields=update_fields + ['changed_at'])
+        return bool(update_fields)
+    
+    def mark_read(self):
+        """Mark the visitor's messages as read by staff and take them off the unread counter"""
+        with transaction.atomic():
+            updated = self.chat_messages.filter(sender_type='user', is_read=False).update(is_read=True)
+            if updated:
+                OnlineChatSession.objects.filter(pk=self.pk).update(
+                    unread_count=Greatest(F('unread_count') - updated, 0), changed_at=timezone.now()
+                )
+        self.unread_count = max(self.unread_count - updated, 0)
+        return updated
 
 
 class OnlineChatMessage(models.Model):
@@ -110,3 +178,29 @@ class AdminOnlineStatus(models.Model):
     def __str__(self):
         return f"{self.admin.username} - {'Online' if self.is_online else 'Offline'}"
 
+
+class OnlineChatArchive(models.Model):
+    """Compressed transcript of an expired online chat session"""
+    session_id = models.CharField(max_length=100, unique=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_chat_sessions')
+    name = models.CharField(max_length=100, blank=True)
+    email = models.EmailField(blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    transcript = models.BinaryField(help_text='zlib-compressed JSON list of the session messages')
+    started_at = models.DateTimeField()
+    last_activity = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-archived_at']
+    
+    def __str__(self):
+        return f"Archive: {self.session_id} ({self.message_count} messages)"
+    
+    @staticmethod
+    def compress_messages(messages):
+        return zlib.compress(json.dumps(messages, separators=(',', ':')).encode('utf-8'))
+    
+    def get_messages(self):
+        """Decompressed list of message dicts"""
+        return json.loads(zlib.decompress(bytes(self.transcript)).decode('utf-8'))
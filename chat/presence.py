@@ -0,0 +1,76 @@
+"""
+Admin presence for the online chat.
+
+Staff requests record a heartbeat in the cache. ``AdminOnlineStatus`` is
+only written when the cached heartbeat is older than
+CHAT_PRESENCE_FLUSH_INTERVAL, and admins without a heartbeat for
+CHAT_PRESENCE_TIMEOUT are marked offline by a throttled sweep.
+
+The "is any admin online" answer polled by the widget is shared through the
+cache for CHAT_PRESENCE_CACHE_TTL seconds; heartbeats refresh it and the
+sweep invalidates it.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import AdminOnlineStatus
+
+SWEEP_CACHE_KEY = 'chat:presence:sweep'
+ANY_ONLINE_CACHE_KEY = 'chat:presence:any-online'
+
+
+def get_presence_timeout():
+    return getattr(settings, 'CHAT_PRESENCE_TIMEOUT', 300)
+
+
+def get_flush_interval():
+    return getattr(settings, 'CHAT_PRESENCE_FLUSH_INTERVAL', 60)
+
+
+def get_presence_cache_ttl():
+    return getattr(settings, 'CHAT_PRESENCE_CACHE_TTL', 10)
+
+
+def heartbeat_cache_key(user_id):
+    return f'chat:presence:admin:{user_id}'
+
+
+def record_heartbeat(user):
+    """Mark a staff user as online, writing to the database at most once per flush interval"""
+    now = timezone.now()
+    key = heartbeat_cache_key(user.pk)
+    last_flushed = cache.get(key)
+    if last_flushed and now - last_flushed < timedelta(seconds=get_flush_interval()):
+        return
+
+    cache.set(key, now, get_presence_timeout())
+    updated = AdminOnlineStatus.objects.filter(admin=user).update(is_online=True, last_seen=now)
+    if not updated:
+        AdminOnlineStatus.objects.get_or_create(admin=user, defaults={'is_online': True})
+    cache.set(ANY_ONLINE_CACHE_KEY, True, get_presence_cache_ttl())
+    expire_inactive_admins()
+
+
+def expire_inactive_admins(force=False):
+    """Mark admins without a recent heartbeat offline (at most once per flush interval)"""
+    if not force and not cache.add(SWEEP_CACHE_KEY, True, get_flush_interval()):
+        return 0
+    cutoff = timezone.now() - timedelta(seconds=get_presence_timeout())
+    expired = AdminOnlineStatus.objects.filter(is_online=True, last_seen__lt=cutoff).update(is_online=False)
+    if expired:
+        cache.delete(ANY_ONLINE_CACHE_KEY)
+    return expired
+
+
+def any_admin_online():
+    """Whether at least one admin has sent a heartbeat within the presence timeout"""
+    online = cache.get(ANY_ONLINE_CACHE_KEY)
+    if online is not None:
+        return online
+
+    expire_inactive_admins()
+    cutoff = timezone.now() - timedelta(seconds=get_presence_timeout())
+    online = AdminOnlineStatus.objects.filter(is_online=True, last_seen__gte=cutoff).exists()
+    cache.set(ANY_ONLINE_CACHE_KEY, online, get_presence_cache_ttl())
+    return online
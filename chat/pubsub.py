@@ -0,0 +1,78 @@
+"""
+Publish/subscribe layer for ChatRoom messages.
+
+Async views subscribe to a group and receive payloads published from any
+thread (model signals run in synchronous code). The backend is configured
+with CHAT_PUBSUB_BACKEND, so a Redis-backed layer exposing the same
+``publish``/``subscribe`` interface can replace the in-memory one when the
+site runs more than one ASGI process.
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Queued to a subscriber that fell too far behind; it should resync from the database
+RESYNC = object()
+
+
+class InMemoryPubSub:
+    """Single-process pub/sub: every subscriber owns a bounded asyncio.Queue"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def publish(self, group, payload):
+        """Deliver payload to every subscriber of group; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._groups.get(group, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, payload)
+            except RuntimeError:
+                # The subscriber's event loop has already been closed
+                pass
+
+    @staticmethod
+    def _put(queue, payload):
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            payload = RESYNC
+        queue.put_nowait(payload)
+
+    @asynccontextmanager
+    async def subscribe(self, group):
+        """Yield an asyncio.Queue receiving the group's payloads until the block exits"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._groups.setdefault(group, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._groups.get(group)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._groups[group]
+
+
+_pubsub = None
+
+
+def get_pubsub():
+    """The process-wide pub/sub backend named by CHAT_PUBSUB_BACKEND"""
+    global _pubsub
+    if _pubsub is None:
+        backend = getattr(settings, 'CHAT_PUBSUB_BACKEND', 'chat.pubsub.InMemoryPubSub')
+        _pubsub = import_string(backend)()
+    return _pubsub
+
+
+def room_group(room_id):
+    """Pub/sub group for a ChatRoom"""
+    return f'chat-room:{room_id}'
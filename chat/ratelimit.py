@@ -0,0 +1,73 @@
+"""
+Token-bucket rate limiting for the anonymous chat endpoints.
+
+Buckets live in the cache named by CHAT_RATE_LIMIT_CACHE, so the limiter
+needs no database access and rejects floods before a view touches the ORM.
+Each client is limited per session cookie and, more loosely, per IP address,
+so rotating cookies does not escape the limit. Bucket updates are not atomic:
+concurrent requests may overshoot a limit by a request or two, which is
+acceptable for flood protection.
+"""
+import math
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+# scope: (tokens refilled per second, bucket size)
+DEFAULT_RATE_LIMITS = {
+    'online_chat_send': (0.5, 5),
+    'online_chat_poll': (2, 30),
+}
+
+# Several visitors may share an address (NAT, offices), so IP buckets are larger
+IP_BUCKET_FACTOR = 5
+
+
+def get_rate_limit(scope):
+    limits = getattr(settings, 'CHAT_RATE_LIMITS', {})
+    return limits.get(scope, DEFAULT_RATE_LIMITS[scope])
+
+
+def take_token(cache, key, rate, burst):
+    """Take one token from the bucket; return seconds to wait, or 0 if allowed"""
+    now = time.time()
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), math.ceil(burst / rate) + 1)
+    return 0
+
+
+def check_rate_limit(request, scope):
+    """Return seconds until the request would be allowed, or 0 if it is allowed now"""
+    rate, burst = get_rate_limit(scope)
+    cache = caches[getattr(settings, 'CHAT_RATE_LIMIT_CACHE', 'default')]
+
+    buckets = [(f'ip:{request.META.get("REMOTE_ADDR", "")}', rate * IP_BUCKET_FACTOR, burst * IP_BUCKET_FACTOR)]
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        buckets.append((f'session:{session_key}', rate, burst))
+
+    wait = 0
+    for client, bucket_rate, bucket_burst in buckets:
+        wait = max(wait, take_token(cache, f'chat:ratelimit:{scope}:{client}', bucket_rate, bucket_burst))
+    return wait
+
+
+def rate_limit(scope, methods=None):
+    """Reject requests over the scope's limit with 429, optionally only for some HTTP methods"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = check_rate_limit(request, scope)
+                if wait:
+                    response = JsonResponse({'error': 'Too many requests, please slow down'}, status=429)
+                    response['Retry-After'] = math.ceil(wait)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
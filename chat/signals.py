@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from core.notifications import notification_hub
+from .models import ChatRoom, ChatMessage, OnlineChatSession, OnlineChatMessage
+from .pubsub import get_pubsub, room_group
+
+
+def online_chat_channel(session_pk):
+    """Notification hub key for an online chat session"""
+    return f'online-chat:{session_pk}'
+
+
+@receiver(post_save, sender=OnlineChatMessage)
+def notify_online_chat_message(sender, instance, created, **kwargs):
+    """Wake long-poll requests waiting on the message's session"""
+    if created:
+        key = online_chat_channel(instance.session_id)
+        transaction.on_commit(lambda: notification_hub.publish(key))
+
+
+@receiver(post_save, sender=ChatMessage)
+def broadcast_chat_message(sender, instance, created, **kwargs):
+    """Push new ChatRoom messages to the room's stream subscribers"""
+    if created:
+        group, payload = room_group(instance.room_id), instance.serialize()
+        transaction.on_commit(lambda: get_pubsub().publish(group, payload))
+
+
+@receiver(post_save, sender=ChatMessage)
+def count_unread_chat_message(sender, instance, created, **kwargs):
+    """Bump the recipient's unread counter on the room"""
+    if created and not instance.is_read:
+        counter = 'lawyer_unread_count' if instance.sender_id == instance.room.user_id else 'user_unread_count'
+        ChatRoom.objects.filter(pk=instance.room_id).update(**{counter: F(counter) + 1})
+
+
+@receiver(post_save, sender=OnlineChatMessage)
+def track_online_chat_message(sender, instance, created, **kwargs):
+    """Bump the session's activity time and, for visitor messages, its unread counter"""
+    if created:
+        changes = {'last_activity': instance.created_at, 'changed_at': instance.created_at}
+        if instance.sender_type == 'user' and not instance.is_read:
+            changes['unread_count'] = F('unread_count') + 1
+        OnlineChatSession.objects.filter(pk=instance.session_id).update(**changes)
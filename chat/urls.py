@@ -6,12 +6,20 @@ app_name = 'chat'
 urlpatterns = [
     path('', views.chat_home, name='home'),
     path('room/<int:pk>/', views.chat_room, name='chat_room'),
+    path('room/<int:pk>/messages/', views.chat_room_messages, name='chat_room_messages'),
+    path('room/<int:pk>/send/', views.chat_room_send, name='chat_room_send'),
+    path('room/<int:pk>/stream/', views.chat_room_stream, name='chat_room_stream'),
     path('consultation/create/', views.create_consultation, name='create_consultation'),
     path('consultations/', views.consultations, name='consultations'),
+    path('api/unread/', views.unread_counts, name='unread_counts'),
     # Online chat widget API
     path('api/online-chat/', views.online_chat_api, name='online_chat_api'),
+    path('api/online-chat/wait/', views.online_chat_wait, name='online_chat_wait'),
+    path('api/online-chat/bootstrap/', views.online_chat_bootstrap, name='online_chat_bootstrap'),
     path('admin/chat/', views.admin_chat_interface, name='admin_chat'),
+    path('admin/chat/sessions/', views.admin_sessions_overview, name='admin_sessions_overview'),
     path('admin/chat/<str:session_id>/send/', views.admin_send_message, name='admin_send_message'),
     path('admin/chat/<str:session_id>/messages/', views.admin_get_messages, name='admin_get_messages'),
+    path('admin/chat/<str:session_id>/wait/', views.admin_wait_messages, name='admin_wait_messages'),
 ]
 
@@ -1,14 +1,30 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, HttpResponseNotModified, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import OuterRef, Q, Subquery
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+import asyncio
 import json
 import uuid
-from .models import ChatRoom, ChatMessage, ConsultationRequest, OnlineChatSession, OnlineChatMessage, AdminOnlineStatus
+from core.notifications import parse_poll_timeout, wait_for
+from .models import ChatRoom, ChatMessage, ConsultationRequest, OnlineChatSession, OnlineChatMessage
 from .forms import ConsultationRequestForm
+from .presence import any_admin_online
+from .pubsub import RESYNC, get_pubsub, room_group
+from .ratelimit import rate_limit
+from .signals import online_chat_channel
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+OVERVIEW_SINCE_OVERLAP = timedelta(seconds=5)
 
 
 def is_staff(user):
@@ -26,21 +42,56 @@ def chat_home(request):
     return render(request, 'chat/home.html', context)
 
 
+CHAT_ROOM_PAGE_SIZE = 50
+
+
+def user_can_access_room(room, user):
+    """Only the room's client and assigned lawyer may see it"""
+    return room.user_id == user.pk or room.lawyer_id == user.pk
+
+
+def encode_message_cursor(message):
+    """Keyset cursor for a ChatMessage: microseconds since epoch and id"""
+    micros = (message.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}_{message.pk}'
+
+
+def decode_message_cursor(value):
+    """Parse a cursor from encode_message_cursor, returning (created_at, id) or None"""
+    try:
+        micros, pk = value.split('_')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_room_messages_page(room, before=None, limit=CHAT_ROOM_PAGE_SIZE):
+    """Up to ``limit`` messages older than the ``before`` cursor, oldest first"""
+    queryset = room.messages.select_related('sender').order_by('-created_at', '-id')
+    if before:
+        created_at, pk = before
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    
+    page = list(queryset[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, has_more
+
+
 @login_required
 def chat_room(request, pk):
     """Chat room detail"""
     room = get_object_or_404(ChatRoom, pk=pk)
     
     # Check access
-    if room.user != request.user and room.lawyer != request.user:
+    if not user_can_access_room(room, request.user):
         messages.error(request, 'You do not have access to this chat room.')
         return redirect('chat:home')
     
-    messages_list = room.messages.all()
-    
-    # Mark messages as read
-    if request.user != room.user:
-        messages_list.filter(is_read=False).update(is_read=True)
+    # Mark messages as read (the counter saves the UPDATE when nothing is unread)
+    if room.unread_count_for(request.user):
+        room.mark_read(request.user)
     
     if request.method == 'POST':
         message_text = request.POST.get('message')
@@ -52,13 +103,144 @@ def chat_room(request, pk):
             )
             return redirect('chat:chat_room', pk=pk)
     
+    # Only the newest page is rendered; older messages are fetched on demand
+    messages_list, has_more = get_room_messages_page(room)
+    
     context = {
         'room': room,
         'messages': messages_list,
+        'has_more': has_more,
+        'older_cursor': encode_message_cursor(messages_list[0]) if messages_list else '',
+        'latest_id': messages_list[-1].pk if messages_list else 0,
+        'live_updates': supports_streaming(request),
     }
     return render(request, 'chat/chat_room.html', context)
 
 
+@login_required
+@require_http_methods(["GET"])
+def chat_room_messages(request, pk):
+    """Load older messages of a chat room (keyset pagination on created_at, id)"""
+    room = get_object_or_404(ChatRoom, pk=pk)
+    if not user_can_access_room(room, request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    before = decode_message_cursor(request.GET.get('before'))
+    if before is None:
+        return JsonResponse({'error': 'A valid "before" cursor is required'}, status=400)
+    
+    messages_list, has_more = get_room_messages_page(room, before=before)
+    
+    return JsonResponse({
+        'messages': [dict(msg.serialize(), is_mine=msg.sender_id == request.user.pk) for msg in messages_list],
+        'has_more': has_more,
+        'cursor': encode_message_cursor(messages_list[0]) if messages_list else None,
+    })
+
+
+# Async ChatRoom views: served without blocking a worker under legal_lab.asgi
+def supports_streaming(request):
+    """Whether the request is served over ASGI; WSGI buffers a streamed response until it ends"""
+    return isinstance(request, ASGIRequest)
+
+
+def get_authenticated_user(request):
+    """Resolve the lazy request.user (touches the session, so call it via sync_to_async)"""
+    return request.user if request.user.is_authenticated else None
+
+
+async def get_room_for_async_request(request, pk):
+    """Return (user, room, None) or (None, None, error response) for an async room view"""
+    user = await sync_to_async(get_authenticated_user)(request)
+    if user is None:
+        return None, None, JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    room = await ChatRoom.objects.filter(pk=pk).afirst()
+    if room is None:
+        return None, None, JsonResponse({'error': 'Room not found'}, status=404)
+    if not user_can_access_room(room, user):
+        return None, None, JsonResponse({'error': 'Access denied'}, status=403)
+    return user, room, None
+
+
+async def chat_room_send(request, pk):
+    """Post a message to a chat room without a page reload; participants get it via the stream"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    
+    user, room, error = await get_room_for_async_request(request, pk)
+    if error:
+        return error
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    message_text = str(data.get('message', '')).strip()
+    if not message_text:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+    
+    message = await ChatMessage.objects.acreate(room=room, sender=user, message=message_text)
+    return JsonResponse(dict(message.serialize(), is_mine=True), status=201)
+
+
+async def chat_room_stream(request, pk):
+    """Server-sent events stream of new messages in a chat room"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not supports_streaming(request):
+        # 204 tells EventSource not to reconnect; the page falls back to posting the form
+        return HttpResponse(status=204)
+    
+    user, room, error = await get_room_for_async_request(request, pk)
+    if error:
+        return error
+    
+    # EventSource resends the last delivered id when it reconnects
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        after_id = int(cursor) if cursor else None
+    except ValueError:
+        after_id = None
+    
+    response = StreamingHttpResponse(room_event_stream(room, user, after_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def format_room_event(payload, user):
+    data = json.dumps(dict(payload, is_mine=payload['sender_id'] == user.pk))
+    return f"id: {payload['id']}\ndata: {data}\n\n"
+
+
+async def room_event_stream(room, user, after_id):
+    """Yield SSE frames for a room: missed messages first, then live ones from the pub/sub layer"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'CHAT_STREAM_MAX_AGE', 300)
+    keepalive = getattr(settings, 'CHAT_STREAM_KEEPALIVE', 15)
+    
+    async with get_pubsub().subscribe(room_group(room.pk)) as queue:
+        if after_id is not None:
+            backlog = ChatMessage.objects.filter(room=room, id__gt=after_id).select_related('sender').order_by('id')
+            async for message in backlog:
+                yield format_room_event(message.serialize(), user)
+                after_id = message.pk
+        
+        # Streams are recycled after CHAT_STREAM_MAX_AGE; the browser reconnects by itself
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                payload = await asyncio.wait_for(queue.get(), min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if payload is RESYNC:
+                break
+            if after_id is None or payload['id'] > after_id:
+                after_id = payload['id']
+                yield format_room_event(payload, user)
+
+
 @login_required
 def create_consultation(request):
     """Create consultation request"""
@@ -91,16 +273,40 @@ def consultations(request):
 
 
 # Online Chat Widget Views
+def serialize_chat_message(msg):
+    """Serialize an online chat message for the widget/admin APIs"""
+    return {
+        'id': msg.id,
+        'sender_type': msg.sender_type,
+        'message': msg.message,
+        'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def parse_after_id(request):
+    """Read the ``after_id`` message cursor from the query string"""
+    try:
+        return max(int(request.GET.get('after_id', 0)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def wait_for_chat_messages(session, after_id, timeout):
+    """Return messages newer than after_id, blocking until one arrives or timeout"""
+    def fetch():
+        return list(OnlineChatMessage.objects.filter(session=session, id__gt=after_id).order_by('id'))
+    
+    return wait_for(online_chat_channel(session.pk), fetch, timeout)
+
+
 def get_or_create_chat_session(request):
     """Get or create chat session for widget"""
     session_id = request.session.get('chat_session_id')
     
     if session_id:
         try:
-            session = OnlineChatSession.objects.get(session_id=session_id, is_active=True)
-            session.last_activity = timezone.now()
-            session.save()
-            return session
+            # last_activity is bumped by the message signal, not here
+            return OnlineChatSession.objects.get(session_id=session_id, is_active=True)
         except OnlineChatSession.DoesNotExist:
             pass
     
@@ -117,35 +323,44 @@ def get_or_create_chat_session(request):
 
 
 @require_http_methods(["GET", "POST"])
+@rate_limit('online_chat_send', methods=('POST',))
+@rate_limit('online_chat_poll', methods=('GET',))
 @ensure_csrf_cookie
 def online_chat_api(request):
     """API endpoint for online chat widget"""
     if request.method == 'GET':
-        # Get messages
+        # Get messages newer than the client's cursor
         session_id = request.session.get('chat_session_id')
         if not session_id:
             return JsonResponse({'messages': [], 'admin_online': False})
         
         try:
             session = OnlineChatSession.objects.get(session_id=session_id)
-            messages = OnlineChatMessage.objects.filter(session=session).order_by('created_at')
-            messages_data = [{
-                'id': msg.id,
-                'sender_type': msg.sender_type,
-                'message': msg.message,
-                'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            } for msg in messages]
-            
-            # Check admin online status
-            admin_online = AdminOnlineStatus.objects.filter(is_online=True).exists()
-            
-            return JsonResponse({
+        except OnlineChatSession.DoesNotExist:
+            return JsonResponse({'messages': [], 'admin_online': False})
+        
+        after_id = parse_after_id(request)
+        messages = OnlineChatMessage.objects.filter(session=session, id__gt=after_id).order_by('id')
+        messages_data = [serialize_chat_message(msg) for msg in messages]
+        last_id = messages_data[-1]['id'] if messages_data else after_id
+        
+        # Check admin online status
+        admin_online = any_admin_online()
+        
+        # Nothing new since the cursor: let the client reuse its cached copy
+        etag = f'"{session.pk}-{last_id}-{int(admin_online)}"'
+        if not messages_data and request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse({
                 'messages': messages_data,
                 'admin_online': admin_online,
-                'session_id': session_id
+                'session_id': session_id,
+                'last_id': last_id,
             })
-        except OnlineChatSession.DoesNotExist:
-            return JsonResponse({'messages': [], 'admin_online': False})
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     elif request.method == 'POST':
         # Send message
@@ -159,12 +374,8 @@ def online_chat_api(request):
         
         session = get_or_create_chat_session(request)
         
-        # Update session info if provided
-        if name:
-            session.name = name
-        if email:
-            session.email = email
-        session.save()
+        # Update session info if provided (no write when unchanged)
+        session.update_contact(name=name, email=email)
         
         # Create message
         sender_type = 'admin' if request.user.is_authenticated and request.user.is_staff else 'user'
@@ -182,26 +393,123 @@ def online_chat_api(request):
         })
 
 
+@require_http_methods(["GET"])
+@rate_limit('online_chat_poll')
+@ensure_csrf_cookie
+def online_chat_bootstrap(request):
+    """First call of the lazily loaded widget: session state and the CSRF cookie"""
+    session_id = request.session.get('chat_session_id')
+    session = OnlineChatSession.objects.filter(session_id=session_id, is_active=True).first() if session_id else None
+    if session is None:
+        return JsonResponse({'session_id': None, 'admin_online': any_admin_online(), 'unread': 0})
+    
+    # Replies the visitor has not seen yet, for the floating button badge
+    try:
+        seen_id = max(int(request.GET.get('seen_id', 0)), 0)
+    except ValueError:
+        seen_id = 0
+    unread = session.chat_messages.filter(sender_type='admin', id__gt=seen_id).count()
+    
+    return JsonResponse({
+        'session_id': session.session_id,
+        'admin_online': any_admin_online(),
+        'unread': unread,
+    })
+
+
+@require_http_methods(["GET"])
+@rate_limit('online_chat_poll')
+def online_chat_wait(request):
+    """Long-poll endpoint for the chat widget: blocks until new messages arrive"""
+    session_id = request.session.get('chat_session_id')
+    if not session_id:
+        return JsonResponse({'messages': [], 'admin_online': False})
+    
+    try:
+        session = OnlineChatSession.objects.get(session_id=session_id)
+    except OnlineChatSession.DoesNotExist:
+        return JsonResponse({'messages': [], 'admin_online': False})
+    
+    after_id = parse_after_id(request)
+    messages = wait_for_chat_messages(session, after_id, parse_poll_timeout(request, 'CHAT_LONG_POLL_TIMEOUT'))
+    messages_data = [serialize_chat_message(msg) for msg in messages]
+    
+    return JsonResponse({
+        'messages': messages_data,
+        'admin_online': any_admin_online(),
+        'session_id': session_id,
+        'last_id': messages_data[-1]['id'] if messages_data else after_id,
+    })
+
+
+def get_sessions_overview(since=None):
+    """Active sessions with their last message annotated, newest activity first; with ``since``, any session changed after it"""
+    last_message = OnlineChatMessage.objects.filter(session=OuterRef('pk')).order_by('-id')
+    if since:
+        # Includes sessions that went inactive, so the dashboard can drop them
+        sessions = OnlineChatSession.objects.filter(changed_at__gt=since)
+    else:
+        sessions = OnlineChatSession.objects.filter(is_active=True)
+    return sessions.annotate(
+        last_message=Subquery(last_message.values('message')[:1]),
+        last_sender_type=Subquery(last_message.values('sender_type')[:1]),
+    ).order_by('-last_activity')
+
+
 @login_required
 @user_passes_test(is_staff)
 def admin_chat_interface(request):
     """Admin interface for managing online chats"""
     
-    # Update admin online status
-    admin_status, created = AdminOnlineStatus.objects.get_or_create(admin=request.user)
-    admin_status.is_online = True
-    admin_status.last_seen = timezone.now()
-    admin_status.save()
-    
     # Get active chat sessions
-    active_sessions = OnlineChatSession.objects.filter(is_active=True).order_by('-last_activity')
+    active_sessions = get_sessions_overview()
     
     context = {
         'active_sessions': active_sessions,
+        'overview_time': timezone.now().isoformat(),
     }
     return render(request, 'chat/admin_chat.html', context)
 
 
+@login_required
+@user_passes_test(is_staff)
+@require_http_methods(["GET"])
+def admin_sessions_overview(request):
+    """Active sessions for the staff dashboard; ``since`` limits it to sessions changed (or deactivated) after that time"""
+    now = timezone.now()
+    since = request.GET.get('since')
+    try:
+        since = parse_datetime(since) if since else None
+    except ValueError:
+        # Well-formed but impossible dates (e.g. month 13) get a full refresh
+        since = None
+    if since:
+        # Overlap a little so rows committed just after the previous query are not skipped
+        since -= OVERVIEW_SINCE_OVERLAP
+    
+    sessions, removed = [], []
+    for session in get_sessions_overview(since):
+        if not session.is_active:
+            removed.append(session.session_id)
+            continue
+        sessions.append({
+            'session_id': session.session_id,
+            'name': session.name or 'Anonymous',
+            'email': session.email,
+            'unread_count': session.unread_count,
+            'last_activity': session.last_activity.isoformat(),
+            'last_message': (session.last_message or '')[:80],
+            'last_sender_type': session.last_sender_type,
+        })
+    
+    return JsonResponse({
+        'sessions': sessions,
+        'removed': removed,
+        'server_time': now.isoformat(),
+        'full': since is None,
+    })
+
+
 @login_required
 @user_passes_test(is_staff)
 @require_http_methods(["POST"])
@@ -223,12 +531,6 @@ def admin_send_message(request, session_id):
             message=message_text
         )
         
-        # Update admin online status
-        admin_status, created = AdminOnlineStatus.objects.get_or_create(admin=request.user)
-        admin_status.is_online = True
-        admin_status.last_seen = timezone.now()
-        admin_status.save()
-        
         return JsonResponse({
             'success': True,
             'message_id': message.id,
@@ -247,12 +549,10 @@ def admin_get_messages(request, session_id):
     try:
         session = OnlineChatSession.objects.get(session_id=session_id)
         messages = OnlineChatMessage.objects.filter(session=session).order_by('created_at')
-        messages_data = [{
-            'id': msg.id,
-            'sender_type': msg.sender_type,
-            'message': msg.message,
-            'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        } for msg in messages]
+        messages_data = [serialize_chat_message(msg) for msg in messages]
+        
+        if session.unread_count:
+            session.mark_read()
         
         return JsonResponse({
             'messages': messages_data,
@@ -266,3 +566,47 @@ def admin_get_messages(request, session_id):
     except OnlineChatSession.DoesNotExist:
         return JsonResponse({'error': 'Session not found'}, status=404)
 
+
+
+@login_required
+@user_passes_test(is_staff)
+@require_http_methods(["GET"])
+def admin_wait_messages(request, session_id):
+    """Long-poll for new messages in a specific session (admin)"""
+    
+    try:
+        session = OnlineChatSession.objects.get(session_id=session_id)
+    except OnlineChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+    
+    after_id = parse_after_id(request)
+    messages = wait_for_chat_messages(session, after_id, parse_poll_timeout(request, 'CHAT_LONG_POLL_TIMEOUT'))
+    messages_data = [serialize_chat_message(msg) for msg in messages]
+    
+    # The admin is looking at the session, so new visitor messages are read
+    if any(msg.sender_type == 'user' for msg in messages):
+        session.mark_read()
+    
+    return JsonResponse({
+        'messages': messages_data,
+        'last_id': messages_data[-1]['id'] if messages_data else after_id,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def unread_counts(request):
+    """Unread badges for the user's chat rooms and, for staff, the active online sessions"""
+    rooms = {}
+    room_rows = ChatRoom.objects.filter(
+        Q(user=request.user, user_unread_count__gt=0) | Q(lawyer=request.user, lawyer_unread_count__gt=0)
+    ).values_list('pk', 'user_id', 'user_unread_count', 'lawyer_unread_count')
+    for pk, user_id, user_unread, lawyer_unread in room_rows:
+        rooms[pk] = user_unread if user_id == request.user.pk else lawyer_unread
+    
+    data = {'rooms': rooms}
+    if request.user.is_staff:
+        data['sessions'] = dict(OnlineChatSession.objects.filter(
+            is_active=True, unread_count__gt=0
+        ).values_list('session_id', 'unread_count'))
+    return JsonResponse(data)
@@ -0,0 +1,79 @@
+"""
+In-process notification hub for long-poll endpoints.
+
+A request thread registers interest in a channel key *before* checking the
+database, then blocks until another thread publishes on that key or the
+timeout expires. Registering first means a publish that races with the
+database check is never lost. Only threads of the same process are woken;
+changes made by other worker processes are picked up when the poll times
+out, or sooner where the endpoint re-checks at an interval.
+
+``wait_for`` wraps that pattern for views, and ``parse_poll_timeout`` reads
+the client's requested timeout.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+
+class NotificationHub:
+    """Wake up threads waiting on a channel key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = {}
+
+    @contextmanager
+    def listen(self, key):
+        """Register a listener for ``key`` and yield its ``threading.Event``"""
+        event = threading.Event()
+        with self._lock:
+            self._listeners.setdefault(key, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                listeners = self._listeners.get(key)
+                if listeners is not None:
+                    listeners.discard(event)
+                    if not listeners:
+                        del self._listeners[key]
+
+    def publish(self, key):
+        """Wake every listener currently waiting on ``key``"""
+        with self._lock:
+            listeners = list(self._listeners.get(key, ()))
+        for event in listeners:
+            event.set()
+
+
+notification_hub = NotificationHub()
+
+
+def parse_poll_timeout(request, setting):
+    """Read the long-poll ``timeout`` (seconds), capped by the named setting"""
+    max_timeout = getattr(settings, setting, 25)
+    try:
+        timeout = float(request.GET.get('timeout', max_timeout))
+    except (TypeError, ValueError):
+        timeout = max_timeout
+    return min(max(timeout, 0), max_timeout)
+
+
+def wait_for(key, fetch, timeout, ready=bool, interval=None):
+    """Return ``fetch()`` once ``ready`` accepts it, waiting up to ``timeout`` seconds for publishes on ``key``"""
+    # Listen before fetching so a change committed in between still wakes us;
+    # ``interval`` also re-fetches periodically, for changes made by other processes
+    deadline = time.monotonic() + timeout
+    with notification_hub.listen(key) as event:
+        result = fetch()
+        while not ready(result):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not event.wait(min(remaining, interval) if interval else remaining) and not interval:
+                break
+            event.clear()
+            result = fetch()
+    return result
@@ -60,8 +60,7 @@ class GameAnswerSubmissionAdmin(admin.ModelAdmin):
 
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
-    list_display = ['user', 'total_points', 'games_completed', 'rank', 'last_updated']
-    list_editable = ['rank']
+    list_display = ['user', 'total_points', 'games_completed', 'last_updated']
     readonly_fields = ['last_updated']
     ordering = ['-total_points']
 
@@ -7,4 +7,5 @@ class GamesConfig(AppConfig):
     
     def ready(self):
         import games.translation
+        import games.signals
 
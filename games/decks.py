@@ -0,0 +1,68 @@
+"""
+Random question decks for quiz matches.
+
+The ids of playable questions (active, with answers) are cached per
+difficulty/category pool under a version that games.signals replaces when a
+QuizQuestion or QuizAnswer is saved or deleted, and that also expires after
+GAMES_CONTENT_VERSION_TTL seconds so workers that do not share the cache
+pick up the change. A deck is sampled from the pool in memory, instead of
+sorting the question table with order_by('?'), and its answers are loaded
+with their questions in one query.
+"""
+import hashlib
+import random
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .models import QuizQuestion, QuizAnswer
+
+POOL_VERSION_KEY = 'games:quiz-pool-version'
+
+
+def pool_version_timeout():
+    # Same bound as game content: edits reach workers without a shared cache when the version expires
+    return getattr(settings, 'GAMES_CONTENT_VERSION_TTL', 60)
+
+
+def get_pool_version():
+    version = cache.get(POOL_VERSION_KEY)
+    if version is None:
+        cache.add(POOL_VERSION_KEY, uuid.uuid4().hex, pool_version_timeout())
+        version = cache.get(POOL_VERSION_KEY)
+    return version
+
+
+def bump_pool_version():
+    cache.set(POOL_VERSION_KEY, uuid.uuid4().hex, pool_version_timeout())
+
+
+def get_question_pool(difficulty='', category=''):
+    """Ids of the playable questions of a pool; blank difficulty/category mean any"""
+    # Categories are free text, so they are hashed to keep the cache key portable
+    category_hash = hashlib.md5(category.encode()).hexdigest()
+    key = f'games:quiz-pool:{get_pool_version()}:{difficulty}:{category_hash}'
+    pool = cache.get(key)
+    if pool is None:
+        questions = QuizQuestion.objects.filter(is_active=True, answers__isnull=False)
+        if difficulty:
+            questions = questions.filter(difficulty=difficulty)
+        if category:
+            questions = questions.filter(category=category)
+        pool = list(questions.values_list('pk', flat=True).distinct())
+        cache.set(key, pool, pool_version_timeout())
+    return pool
+
+
+def build_deck(count, difficulty='', category='', exclude_ids=()):
+    """Up to ``count`` random questions of the pool as (question, answers) pairs"""
+    exclude_ids = set(exclude_ids)
+    pool = [pk for pk in get_question_pool(difficulty, category) if pk not in exclude_ids]
+    return load_deck(random.sample(pool, min(count, len(pool))))
+
+
+def load_deck(question_ids):
+    """The given questions, in that order, as (question, answers) pairs; missing ones are skipped"""
+    questions = {}
+    for answer in QuizAnswer.objects.filter(question_id__in=question_ids).select_related('question'):
+        questions.setdefault(answer.question_id, (answer.question, []))[1].append(answer)
+    return [questions[pk] for pk in question_ids if pk in questions]
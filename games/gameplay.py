@@ -0,0 +1,155 @@
+"""
+Cached game content and gameplay data.
+
+Games are read-mostly content, so each game's whole tree (game, questions,
+answers) is cached per language under the game's content version. The
+version is replaced by games.signals whenever the game, one of its questions
+or one of its answers is saved or deleted, which makes every cached copy of
+the old content unreachable at once. Versions also expire after
+GAMES_CONTENT_VERSION_TTL seconds, which is how processes that do not share
+the cache pick up edits made in another one.
+
+The question plan of a game (ordered question ids, points and which answers
+are correct) is derived from the tree under the same version. Each session's
+progress is a bitmap over the plan's question order, also cached and rebuilt
+from the submissions when it is missing, so checking an answer and finding
+the next question needs no content queries. The bitmap is only a hint: the
+submissions table decides whether an answer is new, and the bitmap is
+rebuilt from it when it turns out to be stale and before a game is finished.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+from .models import Game
+
+PROGRESS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def content_version_key(game_id):
+    return f'games:content-version:{game_id}'
+
+
+def content_version_timeout():
+    # With a per-process cache a bump only reaches the process that saved the
+    # content; letting versions expire bounds how long the others serve it
+    return getattr(settings, 'GAMES_CONTENT_VERSION_TTL', 60)
+
+
+def get_content_version(game_id):
+    """Current content version of a game, starting a new one if it expired"""
+    key = content_version_key(game_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh token rather than a counter, so an expired version can never
+        # come back and revive stale entries
+        cache.add(key, uuid.uuid4().hex, content_version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def bump_content_version(game_id):
+    cache.set(content_version_key(game_id), uuid.uuid4().hex, content_version_timeout())
+
+
+def build_game_tree(game_id):
+    """Game, questions and answers as plain dicts in the active language, or None"""
+    game = Game.objects.filter(pk=game_id).prefetch_related('questions__answers').first()
+    if game is None:
+        return None
+    questions = sorted(game.questions.all(), key=lambda question: (question.order, question.pk))
+    return {
+        'pk': game.pk,
+        'title': game.title,
+        'description': game.description,
+        'scenario': game.scenario,
+        'points_per_question': game.points_per_question,
+        'is_active': game.is_active,
+        'questions': [{
+            'pk': question.pk,
+            'order': question.order,
+            'question_type': question.question_type,
+            'question_text': question.question_text,
+            'points': question.points,
+            'answers': [{
+                'pk': answer.pk,
+                'answer_text': answer.answer_text,
+                'is_correct': answer.is_correct,
+                'explanation': answer.explanation,
+            } for answer in sorted(question.answers.all(), key=lambda answer: (answer.order, answer.pk))],
+        } for question in questions],
+    }
+
+
+def get_game_tree(game_id):
+    """Cached tree of a game for the active language, or None if the game does not exist"""
+    key = f'games:tree:{game_id}:{get_language()}:{get_content_version(game_id)}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_game_tree(game_id)
+        if tree is None:
+            return None
+        # Entries are unreachable once their version expires
+        cache.set(key, tree, content_version_timeout())
+    return tree
+
+
+def get_question(tree, question_id):
+    for question in tree['questions']:
+        if question['pk'] == question_id:
+            return question
+    return None
+
+
+def build_question_plan(version, tree):
+    """Plan of a game: question ids in play order, each with its index, points and answers"""
+    return {
+        # Progress bitmaps record which plan they index into
+        'version': version,
+        'question_ids': [question['pk'] for question in tree['questions']],
+        'questions': {question['pk']: {
+            'index': index,
+            'points': question['points'],
+            'answers': {answer['pk']: answer['is_correct'] for answer in question['answers']},
+        } for index, question in enumerate(tree['questions'])},
+    }
+
+
+def get_question_plan(game_id):
+    version = get_content_version(game_id)
+    key = f'games:plan:{game_id}:{version}'
+    plan = cache.get(key)
+    if plan is None:
+        plan = build_question_plan(version, get_game_tree(game_id))
+        cache.set(key, plan, content_version_timeout())
+    return plan
+
+
+def progress_cache_key(session_id):
+    return f'games:progress:{session_id}'
+
+
+def get_progress(session, plan, refresh=False):
+    """Bitmap of answered questions (bit i = plan question i), rebuilt from submissions on a miss or refresh"""
+    cached = None if refresh else cache.get(progress_cache_key(session.pk))
+    if cached is not None and cached[0] == plan['version']:
+        return cached[1]
+    bits = 0
+    for question_id in session.submissions.values_list('question_id', flat=True):
+        question = plan['questions'].get(question_id)
+        if question is not None:
+            bits |= 1 << question['index']
+    set_progress(session, plan, bits)
+    return bits
+
+
+def set_progress(session, plan, bits):
+    cache.set(progress_cache_key(session.pk), (plan['version'], bits), PROGRESS_CACHE_TIMEOUT)
+
+
+def next_question_id(plan, bits):
+    """First question of the plan not answered yet, or None"""
+    for index, question_id in enumerate(plan['question_ids']):
+        if not bits & (1 << index):
+            return question_id
+    return None
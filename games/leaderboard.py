@@ -0,0 +1,174 @@
+"""
+In-memory sorted leaderboard.
+
+Keeps every Leaderboard entry in a sorted structure so that ``top(n)``,
+``rank_of(user)`` and ``around(user, k)`` are answered from memory with
+binary searches instead of ranking the table on every request.
+
+The structure is loaded from the database on first use and kept current by
+``update``/``remove`` (called from the Leaderboard signals and the game
+completion code). Every GAMES_LEADERBOARD_REFRESH seconds one request
+rebuilds it, which picks up changes made by other worker processes. The
+table is read outside the lock, so other requests keep being answered from
+the old structure meanwhile, and changes made during the rebuild are
+replayed onto the new one before it is swapped in. The backend class is
+configurable with GAMES_LEADERBOARD_BACKEND; it only needs the small
+sorted-set interface of ``SortedListBackend`` (add/remove/rank/index/range).
+"""
+import bisect
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def sort_key(user_id, total_points, last_updated):
+    """Ascending key: more points first, then whoever got there earlier"""
+    return (-total_points, last_updated.timestamp(), user_id)
+
+
+class SortedListBackend:
+    """Sorted set of members kept in a Python list ordered by sort key"""
+
+    def __init__(self):
+        self._keys = []
+        self._members = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, member, key):
+        self.remove(member)
+        bisect.insort(self._keys, key)
+        self._members[member] = key
+
+    def remove(self, member):
+        key = self._members.pop(member, None)
+        if key is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def rank(self, member):
+        """0-based position, or None; members with the same score share the best position"""
+        key = self._members.get(member)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._keys, key[:2])
+
+    def index(self, member):
+        """0-based position of the member itself, or None"""
+        key = self._members.get(member)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._keys, key)
+
+    def range(self, start, stop):
+        """Keys at 0-based positions [start, stop)"""
+        return self._keys[max(start, 0):stop]
+
+
+class LeaderboardService:
+    """Leaderboard queries answered from a sorted in-memory structure"""
+
+    def __init__(self, backend_class=SortedListBackend):
+        self.backend_class = backend_class
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._entries = None
+        self._loaded_at = 0
+        self._pending = None
+
+    def _get_entries(self):
+        refresh = getattr(settings, 'GAMES_LEADERBOARD_REFRESH', 60)
+        if self._entries is None:
+            # Nothing to answer from yet, so wait for the first load
+            with self._reload_lock:
+                if self._entries is None:
+                    self.reload()
+        elif time.monotonic() - self._loaded_at > refresh and self._reload_lock.acquire(blocking=False):
+            # One request rebuilds; the others keep answering from the current structure
+            try:
+                self.reload()
+            finally:
+                self._reload_lock.release()
+        return self._entries
+
+    def reload(self):
+        """Rebuild the structure from the Leaderboard table and swap it in"""
+        from .models import Leaderboard
+
+        with self._lock:
+            self._pending = []
+        entries = self.backend_class()
+        for user_id, total_points, last_updated in Leaderboard.objects.values_list(
+            'user_id', 'total_points', 'last_updated'
+        ).iterator():
+            entries.add(user_id, sort_key(user_id, total_points, last_updated))
+        with self._lock:
+            # Changes made while the table was being read may be missing from it
+            for user_id, key in self._pending:
+                if key is None:
+                    entries.remove(user_id)
+                else:
+                    entries.add(user_id, key)
+            self._pending = None
+            self._entries = entries
+            self._loaded_at = time.monotonic()
+
+    def update(self, user_id, total_points, last_updated):
+        self._apply(user_id, sort_key(user_id, total_points, last_updated))
+
+    def remove(self, user_id):
+        self._apply(user_id, None)
+
+    def _apply(self, user_id, key):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((user_id, key))
+            if self._entries is None:
+                return
+            if key is None:
+                self._entries.remove(user_id)
+            else:
+                self._entries.add(user_id, key)
+
+    @staticmethod
+    def _as_rows(entries, keys, start):
+        """Rows for keys starting at 0-based position ``start``, ties sharing a rank as in rank_of"""
+        rows = []
+        for offset, key in enumerate(keys):
+            if rows and key[:2] == keys[offset - 1][:2]:
+                rank = rows[-1]['rank']
+            elif rows:
+                rank = start + offset + 1
+            else:
+                rank = entries.rank(key[2]) + 1
+            rows.append({'user_id': key[2], 'total_points': -key[0], 'rank': rank})
+        return rows
+
+    def top(self, n):
+        """The best ``n`` entries as dicts with user_id, total_points and rank (1-based)"""
+        entries = self._get_entries()
+        with self._lock:
+            return self._as_rows(entries, entries.range(0, n), 0)
+
+    def rank_of(self, user):
+        """1-based rank of a user, or None if they have no leaderboard entry"""
+        entries = self._get_entries()
+        with self._lock:
+            position = entries.rank(getattr(user, 'pk', user))
+        return None if position is None else position + 1
+
+    def around(self, user, k):
+        """Up to ``k`` entries either side of the user, including the user"""
+        entries = self._get_entries()
+        with self._lock:
+            position = entries.index(getattr(user, 'pk', user))
+            if position is None:
+                return []
+            start = max(position - k, 0)
+            return self._as_rows(entries, entries.range(start, position + k + 1), start)
+
+
+leaderboard_service = LeaderboardService(
+    import_string(getattr(settings, 'GAMES_LEADERBOARD_BACKEND', 'games.leaderboard.SortedListBackend'))
+)
@@ -0,0 +1,49 @@
+"""
+Management command to check stored game session scores against their submissions.
+
+Session scores are maintained incrementally as answers come in; this verifies
+them in bulk against Sum(points_earned) and optionally repairs them.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from games.models import GameSession, GameAnswerSubmission
+
+
+class Command(BaseCommand):
+    help = 'Reports (and with --fix, repairs) game sessions whose score does not match their submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Overwrite mismatched scores with the sum of the submissions')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Sessions repaired per UPDATE (default: 500)')
+
+    def handle(self, *args, **options):
+        expected = Coalesce(Subquery(
+            GameAnswerSubmission.objects.filter(session=OuterRef('pk')).values('session').annotate(
+                total=Sum('points_earned')
+            ).values('total')
+        ), 0)
+        mismatched = list(GameSession.objects.annotate(expected=expected).exclude(
+            score=F('expected')
+        ).values_list('pk', 'score', 'expected'))
+
+        for pk, score, total in mismatched[:20]:
+            self.stdout.write(f'Session {pk}: stored {score}, submissions total {total}')
+        if len(mismatched) > 20:
+            self.stdout.write(f'... and {len(mismatched) - 20} more')
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('[OK] All session scores match their submissions'))
+            return
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING(f'{len(mismatched)} mismatched sessions (run with --fix to repair)'))
+            return
+
+        # Points already awarded to users for completed sessions are left as they are
+        batch_size = options['batch_size']
+        for start in range(0, len(mismatched), batch_size):
+            ids = [pk for pk, _, _ in mismatched[start:start + batch_size]]
+            GameSession.objects.filter(pk__in=ids).update(score=expected)
+        self.stdout.write(self.style.SUCCESS(f'[OK] {len(mismatched)} session scores repaired'))
@@ -0,0 +1,136 @@
+"""
+Matchmaking queue for multiplayer quiz matches.
+
+Players waiting for an opponent are kept in this process, in one FIFO queue
+per (difficulty, category) bucket, so pairing takes the first waiting player
+of the bucket instead of scanning ``searching`` rows. A waiting player owns a
+MultiplayerQuizMatch row in ``searching`` status; pairing fills in player2
+and switches it to ``matched`` with a single conditional UPDATE, and wakes
+the waiting player's long-poll through the notification hub.
+
+When this process has nobody waiting in the bucket, the oldest ``searching``
+rows of the bucket (queued by other worker processes) are claimed with the
+same conditional UPDATE before the player is queued, so players are paired
+across workers. The hub cannot wake a long-poll in another process, so the
+wait endpoint also re-checks the row every GAMES_MATCHMAKING_RECHECK
+seconds. Database work is done outside the queue lock.
+
+Queues are lost when the process restarts; a player who joins again has any
+stale ``searching`` row cancelled, which also ends its old long-poll.
+"""
+import threading
+from collections import OrderedDict
+from django.db import transaction
+from core.notifications import notification_hub
+from .models import MultiplayerQuizMatch
+
+# Searching rows from other processes tried per join before queueing
+CLAIM_ATTEMPTS = 5
+
+
+def quiz_match_channel(match_pk):
+    """Notification hub key for a quiz match"""
+    return f'quiz-match:{match_pk}'
+
+
+def notify_quiz_match(match_pk):
+    key = quiz_match_channel(match_pk)
+    transaction.on_commit(lambda: notification_hub.publish(key))
+
+
+class MatchmakingQueue:
+    """Waiting players per (difficulty, category), paired first come, first served"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._tickets = {}
+
+    def join(self, user, difficulty='', category=''):
+        """Pair the user with a waiting player of the bucket, or queue them; returns the match"""
+        bucket_key = (difficulty, category)
+        with self._lock:
+            ticket = self._tickets.get(user.pk)
+            if ticket is not None and ticket[0] != bucket_key:
+                # Switching buckets gives up the old place in the queue
+                self._cancel(user.pk)
+                ticket = None
+        if ticket is not None:
+            match = MultiplayerQuizMatch.objects.get(pk=ticket[1])
+            if match.status in ('searching', 'matched'):
+                return match
+            with self._lock:
+                self._cancel(user.pk)
+        self.cancel_stale(user)
+
+        match = self._pair_queued(user, bucket_key) or self._pair_searching(user, difficulty, category)
+        if match is not None:
+            return match
+
+        # Nobody to play against yet
+        match = MultiplayerQuizMatch.objects.create(
+            player1=user, status='searching', difficulty=difficulty, category=category
+        )
+        with self._lock:
+            self._buckets.setdefault(bucket_key, OrderedDict())[user.pk] = match.pk
+            self._tickets[user.pk] = (bucket_key, match.pk)
+        return match
+
+    def _pair_queued(self, user, bucket_key):
+        """Pair with the first player queued in this process, if any is still searching"""
+        while True:
+            with self._lock:
+                bucket = self._buckets.get(bucket_key)
+                if not bucket:
+                    return None
+                waiting_user_id, match_pk = bucket.popitem(last=False)
+                del self._tickets[waiting_user_id]
+            match = self._claim(match_pk, user)
+            if match is not None:
+                return match
+
+    def _pair_searching(self, user, difficulty, category):
+        """Pair with a player queued by another process, oldest first"""
+        waiting = MultiplayerQuizMatch.objects.filter(
+            status='searching', difficulty=difficulty, category=category
+        ).exclude(player1=user).order_by('created_at').values_list('pk', flat=True)[:CLAIM_ATTEMPTS]
+        for match_pk in waiting:
+            match = self._claim(match_pk, user)
+            if match is not None:
+                return match
+        return None
+
+    @staticmethod
+    def _claim(match_pk, user):
+        # Conditional, so a waiting player is paired once whichever process gets there first
+        if MultiplayerQuizMatch.objects.filter(pk=match_pk, status='searching').update(
+            player2=user, status='matched'
+        ):
+            notify_quiz_match(match_pk)
+            return MultiplayerQuizMatch.objects.get(pk=match_pk)
+        return None
+
+    def cancel(self, user):
+        """Take the user out of the queue and cancel their searching match"""
+        with self._lock:
+            self._cancel(user.pk)
+        self.cancel_stale(user)
+
+    def _cancel(self, user_id):
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is not None:
+            self._buckets[ticket[0]].pop(user_id, None)
+
+    @staticmethod
+    def cancel_stale(user):
+        """Cancel searching rows left over from a queue this process no longer has"""
+        stale = list(MultiplayerQuizMatch.objects.filter(
+            player1=user, status='searching'
+        ).values_list('pk', flat=True))
+        if stale:
+            MultiplayerQuizMatch.objects.filter(pk__in=stale, status='searching').update(status='cancelled')
+            for match_pk in stale:
+                notify_quiz_match(match_pk)
+
+
+matchmaking_queue = MatchmakingQueue()
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_quizquestion_multiplayerquizmatch_quizanswer_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='leaderboard',
+            name='rank',
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['-total_points', 'last_updated'], name='games_leaderboard_rank_idx'),
+        ),
+    ]
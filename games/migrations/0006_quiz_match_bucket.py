@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_leaderboard_rank_on_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multiplayerquizmatch',
+            name='category',
+            field=models.CharField(blank=True, help_text='Blank for any category', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='multiplayerquizmatch',
+            name='difficulty',
+            field=models.CharField(blank=True, choices=[('basic', 'Basic'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')], help_text='Blank for any difficulty', max_length=20),
+        ),
+    ]
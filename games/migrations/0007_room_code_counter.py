@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    apps.get_model('games', 'RoomCodeCounter').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_quiz_match_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomCodeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:49
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_submissions(apps, schema_editor):
+    GameAnswerSubmission = apps.get_model('games', 'GameAnswerSubmission')
+    duplicates = (
+        GameAnswerSubmission.objects.order_by()
+        .values('session', 'question')
+        .annotate(total=Count('pk'), latest=Max('pk'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        GameAnswerSubmission.objects.filter(
+            session=duplicate['session'], question=duplicate['question']
+        ).exclude(pk=duplicate['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_room_code_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_submissions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gameanswersubmission',
+            constraint=models.UniqueConstraint(fields=('session', 'question'), name='games_submission_session_question_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_unique_answer_submission'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multiplayerquizmatch',
+            index=models.Index(fields=['status', 'difficulty', 'category', 'created_at'], name='games_quizmatch_bucket_idx'),
+        ),
+    ]
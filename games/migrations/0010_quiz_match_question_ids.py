@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_quiz_match_bucket_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multiplayerquizmatch',
+            name='question_ids',
+            field=models.JSONField(blank=True, default=list, help_text='Questions drawn when the match started, in play order'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -109,6 +109,11 @@ class GameAnswerSubmission(models.Model):
     points_earned = models.IntegerField(default=0)
     answered_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'question'], name='games_submission_session_question_uniq'),
+        ]
+    
     def __str__(self):
         return f"{self.session.user.username} - {self.question}"
 
@@ -118,16 +123,28 @@ class Leaderboard(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_entry')
     total_points = models.IntegerField(default=0)
     games_completed = models.IntegerField(default=0)
-    rank = models.IntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-total_points', 'last_updated']
+        indexes = [
+            models.Index(fields=['-total_points', 'last_updated'], name='games_leaderboard_rank_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.total_points} points"
 
 
+class MultiplayerGameRoomQuerySet(models.QuerySet):
+    """Status changes as conditional updates, so concurrent requests cannot both apply one"""
+    
+    def transition(self, from_status, to_status, **changes):
+        """Move matching rooms from one status to another; returns the number of rooms changed"""
+        if to_status not in MultiplayerGameRoom.STATUS_TRANSITIONS[from_status]:
+            raise ValueError(f"Rooms cannot go from '{from_status}' to '{to_status}'")
+        return self.filter(status=from_status).update(status=to_status, **changes)
+
+
 class MultiplayerGameRoom(models.Model):
     """Multiplayer game room for real-time courtroom simulations"""
     STATUS_CHOICES = [
@@ -144,6 +161,16 @@ class MultiplayerGameRoom(models.Model):
         ('investigator', 'Investigator'),
     ]
     
+    # Allowed status changes (see MultiplayerGameRoomQuerySet.transition)
+    STATUS_TRANSITIONS = {
+        'waiting': ('ready', 'completed'),
+        'ready': ('active', 'completed'),
+        'active': ('completed',),
+        'completed': (),
+    }
+    
+    ROOM_CODE_ATTEMPTS = 5
+    
     room_code = models.CharField(max_length=8, unique=True, help_text="Unique room code for joining")
     title = models.CharField(max_length=200)
     scenario = models.TextField(help_text="Courtroom scenario for the game")
@@ -161,6 +188,8 @@ class MultiplayerGameRoom(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
+    objects = MultiplayerGameRoomQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -168,18 +197,34 @@ class MultiplayerGameRoom(models.Model):
         return f"Room {self.room_code} - {self.title}"
     
     def generate_room_code(self):
-        """Generate a unique room code"""
-        import random
-        import string
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            if not MultiplayerGameRoom.objects.filter(room_code=code).exists():
-                return code
+        """Allocate a unique room code"""
+        from .roomcodes import room_code_allocator
+        return room_code_allocator.allocate()
     
     def save(self, *args, **kwargs):
-        if not self.room_code:
+        if self.room_code:
+            return super().save(*args, **kwargs)
+        
+        # Allocated codes never repeat, but may hit a code given out before the allocator
+        # existed or under an earlier permutation key; that collision moves on to the next code
+        for attempt in range(self.ROOM_CODE_ATTEMPTS):
             self.room_code = self.generate_room_code()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.ROOM_CODE_ATTEMPTS - 1 or not MultiplayerGameRoom.objects.filter(
+                    room_code=self.room_code
+                ).exists():
+                    raise
+
+
+class RoomCodeCounter(models.Model):
+    """Next unallocated room code sequence number (see games.roomcodes)"""
+    next_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Room codes allocated: {self.next_value}"
 
 
 class MultiplayerGameMove(models.Model):
@@ -253,6 +298,9 @@ class MultiplayerQuizMatch(models.Model):
     current_question = models.ForeignKey(QuizQuestion, on_delete=models.SET_NULL, null=True, blank=True)
     question_number = models.IntegerField(default=0)
     total_questions = models.IntegerField(default=5)
+    question_ids = models.JSONField(default=list, blank=True, help_text="Questions drawn when the match started, in play order")
+    difficulty = models.CharField(max_length=20, choices=QuizQuestion.DIFFICULTY_CHOICES, blank=True, help_text="Blank for any difficulty")
+    category = models.CharField(max_length=100, blank=True, help_text="Blank for any category")
     winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='won_quiz_matches')
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True)
@@ -260,6 +308,9 @@ class MultiplayerQuizMatch(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'difficulty', 'category', 'created_at'], name='games_quizmatch_bucket_idx'),
+        ]
     
     def __str__(self):
         return f"Match: {self.player1.username} vs {self.player2.username if self.player2 else 'Waiting...'}"
@@ -0,0 +1,336 @@
+"""
+In-memory engine for multiplayer quiz matches.
+
+Each match that is being played has a MatchState in this process holding its
+questions, scores, the current question's deadline and the answers given so
+far. Nothing runs on a timer: the state is advanced whenever it is read or
+answered, closing every question whose deadline has passed (or that both
+players have answered). Matches that nobody reads any more are swept up by
+later requests once their last question's deadline has passed, which records
+them as completed and drops them from memory. The database is only written
+at question boundaries, with one transaction that bulk-creates the
+question's QuizMatchAnswer rows and updates the match row, so polling a
+match costs no queries at all.
+
+The questions are drawn once, by the request that starts the match, and
+saved in MultiplayerQuizMatch.question_ids; question_number counts the ones
+already closed. A process without the match in memory (after a restart, or
+when the players are served by different workers) picks it up from that row
+and plays the same questions. Closing a question is conditional on
+question_number, so only one process can close it; a process that loses
+drops its state and reloads it from the row. Answers held by the losing
+process are lost, so a match is still best served by a single process.
+"""
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone, translation
+from .decks import build_deck, load_deck
+from .models import MultiplayerQuizMatch, QuizMatchAnswer
+
+# Seconds between sweeps for matches nobody is reading any more
+SWEEP_INTERVAL = 60
+
+
+class QuizMatchError(Exception):
+    """An action that is not allowed in the match's current state"""
+
+
+class StaleMatchState(Exception):
+    """The match row was moved on by another process; the in-memory state must be reloaded"""
+
+
+def localized(obj, field):
+    """Field value in every configured language (modeltranslation falls back to the default)"""
+    values = {}
+    for language in settings.MODELTRANSLATION_LANGUAGES:
+        with translation.override(language):
+            values[language] = getattr(obj, field)
+    return values
+
+
+def question_state(question, answers):
+    return {
+        'id': question.pk,
+        'text': localized(question, 'question_text'),
+        'time_limit': question.time_limit,
+        'points': question.points,
+        'answers': [{'id': answer.pk, 'text': localized(answer, 'answer_text')} for answer in answers],
+        'correct': {answer.pk for answer in answers if answer.is_correct},
+    }
+
+
+def draw_questions(match, count, exclude_ids=()):
+    deck = build_deck(count, match.difficulty, match.category, exclude_ids)
+    return [question_state(question, answers) for question, answers in deck]
+
+
+def load_questions(question_ids):
+    return [question_state(question, answers) for question, answers in load_deck(question_ids)]
+
+
+def serialize_match(match, player_id):
+    """State of a match that is not being played in memory (searching, finished or cancelled)"""
+    is_player1 = player_id == match.player1_id
+    data = {
+        'match_id': match.pk,
+        'status': match.status,
+        'question_number': match.question_number,
+        'total_questions': match.total_questions,
+        'score': match.player1_score if is_player1 else match.player2_score,
+        'opponent_score': match.player2_score if is_player1 else match.player1_score,
+        'last_result': None,
+    }
+    if match.status == 'completed':
+        data['winner'] = match.winner_id and ('you' if match.winner_id == player_id else 'opponent')
+    return data
+
+
+class MatchState:
+    """A match being played: searching -> matched -> active -> completed"""
+
+    def __init__(self, match, questions, now):
+        self.match_id = match.pk
+        self.players = (match.player1_id, match.player2_id)
+        self.scores = {match.player1_id: match.player1_score, match.player2_id: match.player2_score}
+        self.status = 'active'
+        self.questions = questions
+        self.closed = match.question_number
+        self.total_questions = match.question_number + len(questions)
+        self.index = 0
+        self.pending = {}
+        self.last_result = None
+        self.winner_id = None
+        self.lock = threading.Lock()
+        self.start_question(now)
+
+    @property
+    def question(self):
+        return self.questions[self.index]
+    
+    @property
+    def ends_at(self):
+        """When the last question times out if nobody answers any more"""
+        return self.deadline + sum(question['time_limit'] for question in self.questions[self.index + 1:])
+
+    def start_question(self, now):
+        self.started = now
+        self.deadline = now + self.question['time_limit']
+        self.pending = {}
+
+    def advance(self, now):
+        """Close every question that is over by ``now``"""
+        while self.status == 'active' and (len(self.pending) == len(self.players) or now >= self.deadline):
+            # A question that timed out ends at its deadline, so the next one starts there
+            self.close_question(min(now, self.deadline))
+
+    def close_question(self, closed_at):
+        question = self.question
+        rows = []
+        for player_id, (answer_id, is_correct, time_taken) in self.pending.items():
+            points = question['points'] if is_correct else 0
+            self.scores[player_id] += points
+            rows.append(QuizMatchAnswer(
+                match_id=self.match_id, player_id=player_id, question_id=question['id'],
+                selected_answer_id=answer_id, is_correct=is_correct,
+                points_earned=points, time_taken=time_taken,
+            ))
+        self.last_result = {
+            'question_id': question['id'],
+            'correct_answers': sorted(question['correct']),
+            'answers': {player_id: answer_id for player_id, (answer_id, _, _) in self.pending.items()},
+        }
+        closed = self.closed
+        self.closed += 1
+        self.index += 1
+
+        changes = {
+            'player1_score': self.scores[self.players[0]],
+            'player2_score': self.scores[self.players[1]],
+            'question_number': self.closed,
+        }
+        if self.index < len(self.questions):
+            changes['current_question_id'] = self.question['id']
+            self.start_question(closed_at)
+        else:
+            self.status = 'completed'
+            first, second = (self.scores[player_id] for player_id in self.players)
+            if first != second:
+                self.winner_id = self.players[0] if first > second else self.players[1]
+            changes.update(status='completed', winner_id=self.winner_id,
+                           current_question_id=None, completed_at=timezone.now())
+
+        with transaction.atomic():
+            # Conditional, so a question is only closed once even if another process holds this match too
+            if not MultiplayerQuizMatch.objects.filter(
+                pk=self.match_id, status='active', question_number=closed
+            ).update(**changes):
+                raise StaleMatchState(self.match_id)
+            QuizMatchAnswer.objects.bulk_create(rows)
+
+    def answer(self, player_id, answer_id, now):
+        """Record a player's answer to the current question; return whether it was correct"""
+        self.advance(now)
+        if self.status != 'active':
+            raise QuizMatchError('The match is over')
+        if player_id in self.pending:
+            raise QuizMatchError('You already answered this question')
+        question = self.question
+        if answer_id not in {answer['id'] for answer in question['answers']}:
+            raise QuizMatchError('Invalid answer')
+        is_correct = answer_id in question['correct']
+        self.pending[player_id] = (answer_id, is_correct, int(now - self.started))
+        self.advance(now)
+        return is_correct
+
+    def serialize(self, player_id, now, language):
+        def text(values):
+            return values.get(language) or values[settings.MODELTRANSLATION_DEFAULT_LANGUAGE]
+
+        opponent_id = self.players[1] if player_id == self.players[0] else self.players[0]
+        data = {
+            'match_id': self.match_id,
+            'status': self.status,
+            'question_number': min(self.closed + 1, self.total_questions),
+            'total_questions': self.total_questions,
+            'score': self.scores[player_id],
+            'opponent_score': self.scores[opponent_id],
+            'last_result': self.last_result and {
+                'question_id': self.last_result['question_id'],
+                'correct_answers': self.last_result['correct_answers'],
+                'your_answer': self.last_result['answers'].get(player_id),
+            },
+        }
+        if self.status == 'active':
+            question = self.question
+            data['question'] = {
+                'id': question['id'],
+                'text': text(question['text']),
+                'answers': [{'id': answer['id'], 'text': text(answer['text'])} for answer in question['answers']],
+                'time_limit': question['time_limit'],
+                'remaining': max(self.deadline - now, 0),
+                'answered': player_id in self.pending,
+                'opponent_answered': opponent_id in self.pending,
+            }
+        else:
+            data['winner'] = self.winner_id and ('you' if self.winner_id == player_id else 'opponent')
+        return data
+
+
+class QuizMatchEngine:
+    """Registry of the matches being played in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matches = {}
+        self._swept_at = time.time()
+
+    def get(self, match_id, player_id):
+        """State of a matched or active match of the player, loading (and starting) it if needed; None otherwise"""
+        self.sweep(time.time())
+        with self._lock:
+            state = self._matches.get(match_id)
+        if state is None:
+            return self.load(match_id, player_id)
+        return state if player_id in state.players else None
+
+    def load(self, match_id, player_id):
+        # Only one of the players may start a match, so outsiders cannot make it active
+        match = MultiplayerQuizMatch.objects.filter(
+            Q(player1_id=player_id) | Q(player2_id=player_id),
+            pk=match_id, status__in=('matched', 'active'), player2__isnull=False,
+        ).first()
+        if match is None:
+            return None
+
+        if match.status == 'matched':
+            questions = draw_questions(match, match.total_questions)
+            if not questions:
+                MultiplayerQuizMatch.objects.filter(pk=match.pk, status='matched').update(status='cancelled')
+                return None
+            # Only the first loader starts the match; the others play the deck it saved
+            if not MultiplayerQuizMatch.objects.filter(pk=match.pk, status='matched').update(
+                status='active', started_at=timezone.now(), total_questions=len(questions),
+                question_ids=[question['id'] for question in questions],
+                current_question_id=questions[0]['id'],
+            ):
+                return self.load(match_id, player_id)
+        elif match.question_ids:
+            questions = load_questions(match.question_ids[match.question_number:])
+        else:
+            # Started before decks were saved on the match
+            answered = QuizMatchAnswer.objects.filter(match=match).values_list('question_id', flat=True)
+            questions = draw_questions(match, match.total_questions - match.question_number, answered)
+
+        if not questions:
+            MultiplayerQuizMatch.objects.filter(pk=match.pk).update(status='cancelled')
+            return None
+
+        with self._lock:
+            return self._matches.setdefault(match_id, MatchState(match, questions, time.time()))
+
+    def run(self, match_id, player_id, action):
+        """Result of ``action(state, now)`` on the player's match, or None if it is not being played"""
+        for _ in range(2):
+            state = self.get(match_id, player_id)
+            if state is None:
+                return None
+            try:
+                with state.lock:
+                    result = action(state, time.time())
+            except StaleMatchState:
+                # Another process closed the question first; start again from the row
+                self.forget(state)
+                continue
+            self.discard_if_over(state)
+            return result
+        return None
+
+    def state_for(self, match_id, player_id, language):
+        """Serialized state of an active match for one of its players, or None"""
+        def read(state, now):
+            state.advance(now)
+            return state.serialize(player_id, now, language)
+        return self.run(match_id, player_id, read)
+
+    def answer(self, match_id, player_id, answer_id, language):
+        """Answer the current question; returns (is_correct, serialized state)"""
+        def answer(state, now):
+            is_correct = state.answer(player_id, answer_id, now)
+            return is_correct, state.serialize(player_id, now, language)
+        result = self.run(match_id, player_id, answer)
+        if result is None:
+            raise QuizMatchError('The match is not being played')
+        return result
+
+    def forget(self, state):
+        with self._lock:
+            if self._matches.get(state.match_id) is state:
+                del self._matches[state.match_id]
+
+    def discard_if_over(self, state):
+        # The match row holds the final result; later reads are served from it
+        if state.status != 'active':
+            with self._lock:
+                self._matches.pop(state.match_id, None)
+
+    def sweep(self, now):
+        """Finish and drop matches whose last question is over, e.g. because both players left"""
+        with self._lock:
+            if now - self._swept_at < SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+            over = [state for state in self._matches.values() if now >= state.ends_at]
+        for state in over:
+            try:
+                with state.lock:
+                    state.advance(now)
+            except StaleMatchState:
+                self.forget(state)
+                continue
+            self.discard_if_over(state)
+
+
+match_engine = QuizMatchEngine()
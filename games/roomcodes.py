@@ -0,0 +1,87 @@
+"""
+Room code allocation for multiplayer rooms.
+
+Codes are 6 base-36 characters. Sequence numbers are reserved from the
+RoomCodeCounter row in blocks (one UPDATE per GAMES_ROOM_CODE_BLOCK codes),
+handed out from memory, and mapped to codes with a keyed permutation of
+0..36**6-1: a Feistel network over 32 bits whose round function is an HMAC
+keyed from SECRET_KEY, cycle-walked until the result falls inside the code
+space. Being a bijection, every sequence number gives a different code and
+creating a room needs no existence checks; being keyed, a code says nothing
+about the codes of other rooms, which matters because the code is all it
+takes to join a room. Changing SECRET_KEY changes the permutation, so a new
+code may then repeat an old room's; the room save retries on that.
+"""
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+from .models import RoomCodeCounter
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+# The network permutes 0..2**32-1, the smallest even bit width that covers CODE_SPACE
+HALF_BITS = 16
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 8
+
+
+def round_value(round_number, half):
+    digest = salted_hmac('games.roomcodes', f'{round_number}:{half}', algorithm='sha256').digest()
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+
+def permute(number):
+    """Keyed bijection of 0..CODE_SPACE-1"""
+    value = number
+    while True:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_number in range(ROUNDS):
+            left, right = right, left ^ round_value(round_number, right)
+        value = (left << HALF_BITS) | right
+        # Cycle-walking: values outside the code space are permuted again, which
+        # always ends because the cycle through ``number`` returns into the space
+        if value < CODE_SPACE:
+            return value
+
+
+def encode_room_code(number):
+    """Room code of a sequence number"""
+    value = permute(number)
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class RoomCodeAllocator:
+    """Hands out room codes from sequence blocks reserved in the database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def reserve_block(self, size):
+        with transaction.atomic():
+            if not RoomCodeCounter.objects.filter(pk=1).update(next_value=F('next_value') + size):
+                RoomCodeCounter.objects.get_or_create(pk=1)
+                RoomCodeCounter.objects.filter(pk=1).update(next_value=F('next_value') + size)
+            end = RoomCodeCounter.objects.values_list('next_value', flat=True).get(pk=1)
+        return end - size, end
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self.reserve_block(getattr(settings, 'GAMES_ROOM_CODE_BLOCK', 100))
+            number = self._next
+            self._next += 1
+        if number >= CODE_SPACE:
+            raise RuntimeError('All room codes are in use')
+        return encode_room_code(number)
+
+
+room_code_allocator = RoomCodeAllocator()
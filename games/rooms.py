@@ -0,0 +1,166 @@
+"""
+In-memory state of multiplayer game rooms.
+
+Each room that is being played keeps its players, status, whose turn it is
+and its most recent moves in this process. Submitting a move checks the turn
+against that state, records it with one conditional UPDATE (so the turn can
+only pass once) and one INSERT, and wakes long-poll requests waiting on the
+room through the notification hub. Clients follow a room with a cursor (the
+last move id they have), so catching up is served from memory.
+
+Views that change a room's players or status call ``room_states.discard`` so
+the next request reloads it. Changes made by another worker process are not
+seen that way, so a state is also reloaded from the database when it is older
+than GAMES_ROOM_STATE_TTL seconds, when a move's conditional UPDATE finds the
+turn already passed, and when the requester is not a member or the game is
+not active (e.g. they joined, or the game was started, on another worker).
+At most GAMES_ROOM_STATES_MAX rooms are kept, least recently used first out,
+and completed rooms are not kept at all.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from django.conf import settings
+from django.db import transaction
+from core.notifications import notification_hub
+from .models import MultiplayerGameRoom, MultiplayerGameMove
+
+RECENT_MOVES = 200
+
+
+class RoomMoveError(Exception):
+    """A move that is not allowed in the room's current state"""
+
+
+def room_channel(room_code):
+    """Notification hub key for a multiplayer room"""
+    return f'game-room:{room_code}'
+
+
+def serialize_move(move, usernames):
+    return {
+        'id': move.pk,
+        'player_id': move.player_id,
+        'player': usernames.get(move.player_id, ''),
+        'move_type': move.move_type,
+        'move_data': move.move_data,
+        'timestamp': move.timestamp.isoformat(),
+    }
+
+
+class RoomState:
+    """A room's players, turn and recent moves"""
+
+    def __init__(self, room, moves):
+        self.room_id = room.pk
+        self.room_code = room.room_code
+        self.status = room.status
+        self.member_ids = {room.created_by_id, room.player1_id, room.player2_id} - {None}
+        self.player_ids = (room.player1_id, room.player2_id)
+        self.current_turn_id = room.current_turn_id
+        self.usernames = {user.pk: user.username for user in (room.player1, room.player2) if user is not None}
+        self.moves = deque((serialize_move(move, self.usernames) for move in moves), maxlen=RECENT_MOVES)
+        self.lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+        self.stale = False
+
+    @property
+    def last_move_id(self):
+        return self.moves[-1]['id'] if self.moves else 0
+
+    def moves_after(self, after_id):
+        """Moves newer than the cursor, from memory unless the client is too far behind"""
+        if self.moves and after_id < self.moves[0]['id'] - 1:
+            moves = MultiplayerGameMove.objects.filter(room_id=self.room_id, pk__gt=after_id).order_by('pk')
+            return [serialize_move(move, self.usernames) for move in moves]
+        return [move for move in self.moves if move['id'] > after_id]
+
+    def apply_move(self, user, move_type, move_data):
+        """Record a move by the player whose turn it is and pass the turn to the other player"""
+        with self.lock:
+            if self.status != 'active':
+                raise RoomMoveError('The game is not active')
+            if user.pk not in self.player_ids:
+                raise RoomMoveError('Only players can make moves')
+            if user.pk != self.current_turn_id:
+                raise RoomMoveError('It is not your turn')
+            next_turn_id = self.player_ids[1] if user.pk == self.player_ids[0] else self.player_ids[0]
+
+            with transaction.atomic():
+                if not MultiplayerGameRoom.objects.filter(
+                    pk=self.room_id, status='active', current_turn=user
+                ).update(current_turn_id=next_turn_id):
+                    # Another process moved the room on; reload it on the next request
+                    self.stale = True
+                    raise RoomMoveError('It is not your turn')
+                move = MultiplayerGameMove.objects.create(
+                    room_id=self.room_id, player=user, move_type=move_type, move_data=move_data
+                )
+
+            self.current_turn_id = next_turn_id
+            data = serialize_move(move, self.usernames)
+            self.moves.append(data)
+
+        key = room_channel(self.room_code)
+        transaction.on_commit(lambda: notification_hub.publish(key))
+        return data
+
+    def serialize(self, moves):
+        return {
+            'status': self.status,
+            'current_turn': self.current_turn_id,
+            'moves': moves,
+            'last_id': moves[-1]['id'] if moves else None,
+        }
+
+
+class RoomStates:
+    """Registry of the rooms loaded in this process, least recently used first"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = OrderedDict()
+
+    def get(self, room_code, user_id=None):
+        """State of a room, loading it if needed or out of date for ``user_id``; None if there is no such room"""
+        with self._lock:
+            state = self._rooms.get(room_code)
+            if state is not None:
+                self._rooms.move_to_end(room_code)
+        if state is None or self.is_stale(state, user_id):
+            state = self.load(room_code)
+        return state
+
+    @staticmethod
+    def is_stale(state, user_id):
+        if state.stale or time.monotonic() - state.loaded_at > getattr(settings, 'GAMES_ROOM_STATE_TTL', 30):
+            return True
+        # The room may have been joined or started on another worker
+        return user_id is not None and (user_id not in state.member_ids or state.status != 'active')
+
+    def load(self, room_code):
+        room = MultiplayerGameRoom.objects.select_related('player1', 'player2').filter(room_code=room_code).first()
+        if room is None:
+            with self._lock:
+                self._rooms.pop(room_code, None)
+            return None
+        state = RoomState(room, reversed(room.moves.order_by('-pk')[:RECENT_MOVES]))
+        with self._lock:
+            if room.status == 'completed':
+                self._rooms.pop(room_code, None)
+            else:
+                self._rooms[room_code] = state
+                self._rooms.move_to_end(room_code)
+                while len(self._rooms) > getattr(settings, 'GAMES_ROOM_STATES_MAX', 1000):
+                    self._rooms.popitem(last=False)
+        return state
+
+    def discard(self, room_code):
+        """Forget a room after its players or status changed, and wake anyone following it"""
+        with self._lock:
+            self._rooms.pop(room_code, None)
+        key = room_channel(room_code)
+        transaction.on_commit(lambda: notification_hub.publish(key))
+
+
+room_states = RoomStates()
@@ -0,0 +1,85 @@
+"""
+Applying a finished game's score to the player's totals.
+
+Points are added with F() expressions in a single transaction, so concurrent
+completions by the same player cannot overwrite each other's totals and no
+other User/Leaderboard columns are rewritten. Completion itself is a
+conditional update on completed=False, which makes it idempotent.
+
+Session scores are kept up to date by applying each answer's point delta
+rather than re-aggregating the submissions. Each (session, question) has
+at most one submission, enforced by a unique constraint, so the delta always
+comes from the row actually replaced; the reconcile_game_scores command
+checks the scores against the aggregate.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import User
+from .leaderboard import leaderboard_service
+from .models import GameSession, GameAnswerSubmission, Leaderboard
+
+
+def replace_answer(submissions, fields):
+    """Overwrite an existing answer; return the points it had, or None if there is none"""
+    previous = submissions.select_for_update().values_list('points_earned', flat=True).first()
+    if previous is not None:
+        submissions.update(**fields)
+    return previous
+
+
+def record_answer(session, question_id, answer_id, is_correct, points_earned, answered_hint=False):
+    """Save or replace the session's answer and add the change in points; return whether one was replaced"""
+    # answered_hint only picks which write is tried first; the unique constraint decides
+    fields = {'selected_answer_id': answer_id, 'is_correct': is_correct, 'points_earned': points_earned}
+    submissions = GameAnswerSubmission.objects.filter(session=session, question_id=question_id)
+    
+    with transaction.atomic():
+        previous = replace_answer(submissions, fields) if answered_hint else None
+        if previous is None:
+            try:
+                with transaction.atomic():
+                    GameAnswerSubmission.objects.create(session=session, question_id=question_id, **fields)
+            except IntegrityError:
+                # Answered meanwhile, or the hint was stale: the delta comes from the row replaced
+                previous = replace_answer(submissions, fields)
+        
+        delta = points_earned - (previous or 0)
+        if delta:
+            GameSession.objects.filter(pk=session.pk).update(score=F('score') + delta)
+    session.score += delta
+    return previous is not None
+
+
+def complete_game_session(session):
+    """Complete the session and award its score once; return False if it was already completed"""
+    now = timezone.now()
+    with transaction.atomic():
+        # Only the request that flips completed awards the points, so a double submit
+        # or two concurrent final answers cannot count the game twice
+        if not GameSession.objects.filter(pk=session.pk, completed=False).update(completed=True, completed_at=now):
+            return False
+        session.completed = True
+        session.completed_at = now
+        # Concurrent answers may have moved the score since this session was loaded
+        session.score = GameSession.objects.values_list('score', flat=True).get(pk=session.pk)
+        
+        User.objects.filter(pk=session.user_id).update(total_points=F('total_points') + session.score)
+        
+        entries = Leaderboard.objects.filter(user_id=session.user_id)
+        changes = {
+            'total_points': F('total_points') + session.score,
+            'games_completed': F('games_completed') + 1,
+            'last_updated': now,
+        }
+        if not entries.update(**changes):
+            # Entry normally exists from the user signal; recreate it from the user's points
+            user_points = User.objects.values_list('total_points', flat=True).get(pk=session.user_id)
+            Leaderboard.objects.get_or_create(
+                user_id=session.user_id, defaults={'total_points': user_points - session.score}
+            )
+            entries.update(**changes)
+        
+        total_points = entries.values_list('total_points', flat=True).get()
+        transaction.on_commit(lambda: leaderboard_service.update(session.user_id, total_points, now))
+    return True
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .decks import bump_pool_version
+from .gameplay import bump_content_version
+from .leaderboard import leaderboard_service
+from .models import Game, GameQuestion, GameAnswer, Leaderboard, QuizQuestion, QuizAnswer
+
+
+@receiver(post_save, sender=Leaderboard)
+def sync_leaderboard_entry(sender, instance, **kwargs):
+    """Keep the in-memory leaderboard in step with saved entries"""
+    leaderboard_service.update(instance.user_id, instance.total_points, instance.last_updated)
+
+
+@receiver(post_delete, sender=Leaderboard)
+def drop_leaderboard_entry(sender, instance, **kwargs):
+    """Remove deleted entries from the in-memory leaderboard"""
+    leaderboard_service.remove(instance.user_id)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def bump_game_version(sender, instance, **kwargs):
+    """Retire the cached content (tree and question plan) of an edited game"""
+    bump_content_version(instance.pk)
+
+
+@receiver(post_save, sender=GameQuestion)
+@receiver(post_delete, sender=GameQuestion)
+def bump_question_game_version(sender, instance, **kwargs):
+    bump_content_version(instance.game_id)
+
+
+@receiver(post_save, sender=GameAnswer)
+@receiver(post_delete, sender=GameAnswer)
+def bump_answer_game_version(sender, instance, **kwargs):
+    # The question is already gone when answers are deleted along with it; its own
+    # post_delete bumps the version then
+    game_id = GameQuestion.objects.filter(pk=instance.question_id).values_list('game_id', flat=True).first()
+    if game_id is not None:
+        bump_content_version(game_id)
+
+
+@receiver(post_save, sender=QuizQuestion)
+@receiver(post_delete, sender=QuizQuestion)
+@receiver(post_save, sender=QuizAnswer)
+@receiver(post_delete, sender=QuizAnswer)
+def bump_quiz_pools(sender, **kwargs):
+    """Retire the cached quiz question pools after an edit (e.g. toggling is_active)"""
+    bump_pool_version()
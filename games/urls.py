@@ -15,6 +15,15 @@ urlpatterns = [
     path('multiplayer/', views.multiplayer_home, name='multiplayer_home'),
     path('multiplayer/create/', views.create_multiplayer_room, name='create_multiplayer_room'),
     path('multiplayer/room/<str:room_code>/', views.multiplayer_room, name='multiplayer_room'),
+    path('multiplayer/room/<str:room_code>/start/', views.start_multiplayer_room, name='start_multiplayer_room'),
+    path('multiplayer/room/<str:room_code>/move/', views.multiplayer_room_move, name='multiplayer_room_move'),
+    path('multiplayer/room/<str:room_code>/moves/', views.multiplayer_room_moves, name='multiplayer_room_moves'),
     path('multiplayer/join/', views.join_multiplayer_room, name='join_multiplayer_room'),
+    # Multiplayer quiz
+    path('quiz/matchmaking/join/', views.quiz_matchmaking_join, name='quiz_matchmaking_join'),
+    path('quiz/matchmaking/cancel/', views.quiz_matchmaking_cancel, name='quiz_matchmaking_cancel'),
+    path('quiz/matchmaking/<int:match_id>/wait/', views.quiz_matchmaking_wait, name='quiz_matchmaking_wait'),
+    path('quiz/match/<int:match_id>/state/', views.quiz_match_state, name='quiz_match_state'),
+    path('quiz/match/<int:match_id>/answer/', views.quiz_match_answer, name='quiz_match_answer'),
 ]
 
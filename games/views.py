@@ -1,10 +1,22 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_http_methods
+from django.utils.translation import get_language
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
+from django.conf import settings
+from django.db.models import Count, F, Q
 from django.db import models
-from .models import GameType, Game, GameSession, GameQuestion, GameAnswer, Leaderboard, MultiplayerGameRoom
+import json
+from .models import GameType, Game, GameSession, Leaderboard, MultiplayerGameRoom, MultiplayerQuizMatch, QuizQuestion
 from accounts.models import User
+from core.notifications import parse_poll_timeout, wait_for
+from .leaderboard import leaderboard_service
+from .scoring import record_answer, complete_game_session
+from .quiz import QuizMatchError, match_engine, serialize_match
+from .matchmaking import matchmaking_queue, quiz_match_channel
+from .rooms import RoomMoveError, room_channel, room_states
+from .gameplay import get_game_tree, get_question, get_question_plan, get_progress, set_progress, next_question_id
 
 
 def games_home(request):
@@ -34,19 +46,20 @@ def game_type_detail(request, pk):
 @login_required
 def game_detail(request, pk):
     """Game detail and play page"""
-    game = get_object_or_404(Game, pk=pk, is_active=True)
-    questions = game.questions.all()
+    game = get_game_tree(pk)
+    if game is None or not game['is_active']:
+        raise Http404
     
     # Check if user has an active session
     active_session = GameSession.objects.filter(
         user=request.user,
-        game=game,
+        game_id=pk,
         completed=False
     ).first()
     
     context = {
         'game': game,
-        'questions': questions,
+        'questions': game['questions'],
         'active_session': active_session,
     }
     return render(request, 'games/game_detail.html', context)
@@ -55,129 +68,97 @@ def game_detail(request, pk):
 @login_required
 def start_game(request, pk):
     """Start a new game session"""
-    game = get_object_or_404(Game, pk=pk, is_active=True)
+    game = get_game_tree(pk)
+    if game is None or not game['is_active']:
+        raise Http404
     
     # Create new session
     session = GameSession.objects.create(
         user=request.user,
-        game=game,
-        total_points=game.questions.count() * game.points_per_question
+        game_id=pk,
+        total_points=len(game['questions']) * game['points_per_question']
     )
     
     return redirect('games:play_game', session_id=session.pk)
 
 
+def finish_game(request, session):
+    """Complete the session (once) and send the player to the result page"""
+    if complete_game_session(session):
+        messages.success(request, f"Game completed! You earned {session.score} points!")
+    return redirect('games:game_result', session_id=session.pk)
+
+
 @login_required
 def play_game(request, session_id):
     """Play game - answer questions"""
-    session = get_object_or_404(GameSession, pk=session_id, user=request.user, completed=False)
-    questions = session.game.questions.all()
+    session = get_object_or_404(GameSession, pk=session_id, user=request.user)
+    if session.completed:
+        # e.g. a repeated final submit; the game was already scored
+        return redirect('games:game_result', session_id=session.pk)
+    game = get_game_tree(session.game_id)
+    plan = get_question_plan(session.game_id)
+    answered = get_progress(session, plan)
     
     if request.method == 'POST':
-        question_id = request.POST.get('question_id')
-        answer_id = request.POST.get('answer_id')
-        
-        question = get_object_or_404(GameQuestion, pk=question_id, game=session.game)
-        answer = get_object_or_404(GameAnswer, pk=answer_id, question=question)
-        
-        # Check if already answered
-        submission, created = GameAnswerSubmission.objects.get_or_create(
-            session=session,
-            question=question,
-            defaults={
-                'selected_answer': answer,
-                'is_correct': answer.is_correct,
-                'points_earned': question.points if answer.is_correct else 0,
-            }
-        )
+        try:
+            question_id = int(request.POST.get('question_id'))
+            answer_id = int(request.POST.get('answer_id'))
+        except (TypeError, ValueError):
+            raise Http404
         
-        if not created:
-            # Update existing submission
-            submission.selected_answer = answer
-            submission.is_correct = answer.is_correct
-            submission.points_earned = question.points if answer.is_correct else 0
-            submission.save()
+        question = plan['questions'].get(question_id)
+        if question is None or answer_id not in question['answers']:
+            raise Http404
+        is_correct = question['answers'][answer_id]
+        points_earned = question['points'] if is_correct else 0
         
-        # Update session score
-        session.score = session.submissions.aggregate(
-            total=Sum('points_earned')
-        )['total'] or 0
-        session.save()
+        # Save the answer (replacing an earlier one) and update the session score
+        question_bit = 1 << question['index']
+        replaced = record_answer(session, question_id, answer_id, is_correct, points_earned, bool(answered & question_bit))
+        if replaced and not answered & question_bit:
+            # The cached progress missed an answer saved elsewhere
+            answered = get_progress(session, plan, refresh=True)
+        else:
+            answered |= question_bit
+            set_progress(session, plan, answered)
+        if next_question_id(plan, answered) is None:
+            # Only the submissions decide that the game is over
+            answered = get_progress(session, plan, refresh=True)
         
         # Check if there are more questions
-        answered_question_ids = list(session.submissions.values_list('question_id', flat=True))
-        remaining_questions = questions.exclude(pk__in=answered_question_ids)
-        
-        if remaining_questions.exists():
+        if next_question_id(plan, answered) is not None:
             # Store answer feedback in session for display
             request.session[f'last_answer_{session_id}_{question_id}'] = {
-                'correct': answer.is_correct,
-                'explanation': answer.explanation,
-                'points': submission.points_earned
+                'correct': is_correct,
+                'explanation': next(
+                    answer['explanation'] for answer in get_question(game, question_id)['answers']
+                    if answer['pk'] == answer_id
+                ),
+                'points': points_earned
             }
-            messages.success(request, f"Answer submitted! {'Correct! +' + str(submission.points_earned) + ' points' if answer.is_correct else 'Incorrect. Try the next question!'}")
+            messages.success(request, f"Answer submitted! {'Correct! +' + str(points_earned) + ' points' if is_correct else 'Incorrect. Try the next question!'}")
         else:
             # No more questions, complete the game
-            from django.utils import timezone
-            session.completed = True
-            session.completed_at = timezone.now()
-            session.save()
-            
-            # Update user points
-            request.user.total_points += session.score
-            request.user.save()
-            
-            # Update leaderboard
-            leaderboard, _ = Leaderboard.objects.get_or_create(user=request.user)
-            leaderboard.total_points = request.user.total_points
-            leaderboard.games_completed = GameSession.objects.filter(
-                user=request.user,
-                completed=True
-            ).count()
-            leaderboard.save()
-            
-            # Update ranks
-            update_leaderboard_ranks()
-            
-            messages.success(request, f"Game completed! You earned {session.score} points!")
-            return redirect('games:game_result', session_id=session_id)
+            return finish_game(request, session)
         
         return redirect('games:play_game', session_id=session_id)
     
-    # Get unanswered questions
-    answered_question_ids = session.submissions.values_list('question_id', flat=True)
-    current_question = questions.exclude(pk__in=answered_question_ids).first()
+    # Get the first unanswered question
+    current_question_id = next_question_id(plan, answered)
+    if current_question_id is None:
+        answered = get_progress(session, plan, refresh=True)
+        current_question_id = next_question_id(plan, answered)
     
-    if not current_question:
+    if current_question_id is None:
         # All questions answered, complete session
-        from django.utils import timezone
-        session.completed = True
-        session.completed_at = timezone.now()
-        session.save()
-        
-        # Update user points
-        request.user.total_points += session.score
-        request.user.save()
-        
-        # Update leaderboard
-        leaderboard, _ = Leaderboard.objects.get_or_create(user=request.user)
-        leaderboard.total_points = request.user.total_points
-        leaderboard.games_completed = GameSession.objects.filter(
-            user=request.user,
-            completed=True
-        ).count()
-        leaderboard.save()
-        
-        # Update ranks
-        update_leaderboard_ranks()
-        
-        messages.success(request, f"Game completed! You earned {session.score} points!")
-        return redirect('games:game_result', session_id=session_id)
+        return finish_game(request, session)
     
     context = {
         'session': session,
-        'current_question': current_question,
-        'progress': (len(list(answered_question_ids)) / questions.count()) * 100 if questions.count() > 0 else 0,
+        'game': game,
+        'current_question': get_question(game, current_question_id),
+        'progress': bin(answered).count('1') / len(plan['question_ids']) * 100,
     }
     return render(request, 'games/play_game.html', context)
 
@@ -197,7 +178,14 @@ def game_result(request, session_id):
 
 def leaderboard(request):
     """Leaderboard page"""
-    entries = Leaderboard.objects.all()[:100]
+    top = leaderboard_service.top(100)
+    rows = Leaderboard.objects.select_related('user').in_bulk([row['user_id'] for row in top], field_name='user_id')
+    entries = []
+    for row in top:
+        entry = rows.get(row['user_id'])
+        if entry is not None:
+            entry.position = row['rank']
+            entries.append(entry)
     
     context = {
         'entries': entries,
@@ -205,14 +193,6 @@ def leaderboard(request):
     return render(request, 'games/leaderboard.html', context)
 
 
-def update_leaderboard_ranks():
-    """Update leaderboard ranks"""
-    entries = Leaderboard.objects.all().order_by('-total_points', 'last_updated')
-    for rank, entry in enumerate(entries, start=1):
-        entry.rank = rank
-        entry.save(update_fields=['rank'])
-
-
 @login_required
 def multiplayer_home(request):
     """Multiplayer games home"""
@@ -260,27 +240,32 @@ def join_multiplayer_room(request):
     if request.method == 'POST':
         room_code = request.POST.get('room_code', '').upper().strip()
         
-        try:
-            room = MultiplayerGameRoom.objects.get(room_code=room_code)
-            
-            if room.status in ['waiting', 'ready']:
-                if room.player1 == request.user or room.player2 == request.user:
-                    messages.info(request, 'You are already in this room!')
-                elif not room.player1:
-                    room.player1 = request.user
-                    room.save()
-                elif not room.player2:
-                    room.player2 = request.user
-                    room.status = 'ready'
-                    room.save()
-                    messages.success(request, 'Successfully joined room!')
-                else:
-                    messages.error(request, 'Room is full!')
-                return redirect('games:multiplayer_room', room_code=room_code)
-            else:
-                messages.error(request, 'Room is not available for joining!')
-        except MultiplayerGameRoom.DoesNotExist:
+        # Take the free second seat in one conditional UPDATE, so two players joining
+        # at once cannot both get it
+        if MultiplayerGameRoom.objects.filter(
+            room_code=room_code, player1__isnull=False, player2__isnull=True
+        ).exclude(player1=request.user).transition('waiting', 'ready', player2=request.user):
+            room_states.discard(room_code)
+            messages.success(request, 'Successfully joined room!')
+            return redirect('games:multiplayer_room', room_code=room_code)
+        
+        # Work out why the seat could not be taken
+        room = MultiplayerGameRoom.objects.filter(room_code=room_code).first()
+        if room is None:
             messages.error(request, 'Room not found!')
+        elif room.status not in ['waiting', 'ready']:
+            messages.error(request, 'Room is not available for joining!')
+        elif request.user.pk in (room.player1_id, room.player2_id):
+            messages.info(request, 'You are already in this room!')
+            return redirect('games:multiplayer_room', room_code=room_code)
+        elif room.player1_id is None and MultiplayerGameRoom.objects.filter(
+            pk=room.pk, status__in=['waiting', 'ready'], player1__isnull=True
+        ).update(player1=request.user):
+            room_states.discard(room_code)
+            return redirect('games:multiplayer_room', room_code=room_code)
+        else:
+            messages.error(request, 'Room is full!')
+            return redirect('games:multiplayer_room', room_code=room_code)
     
     return redirect('games:multiplayer_home')
 
@@ -288,8 +273,7 @@ def join_multiplayer_room(request):
 @login_required
 def multiplayer_room(request, room_code):
     """Multiplayer game room view"""
-    from django.utils import timezone
-    from .models import MultiplayerGameRoom, MultiplayerGameMove
+    from .models import MultiplayerGameRoom
     
     room = get_object_or_404(MultiplayerGameRoom, room_code=room_code)
     
@@ -298,23 +282,168 @@ def multiplayer_room(request, room_code):
         messages.error(request, 'You do not have access to this room!')
         return redirect('games:multiplayer_home')
     
-    # Start game if both players are ready
-    if room.status == 'ready' and room.player1 and room.player2:
-        if not room.started_at:
-            room.status = 'active'
-            room.started_at = timezone.now()
-            room.current_turn = room.player1
-            room.save()
-    
-    # Get game moves
-    moves = room.moves.all()[:50]
+    # Latest moves; the page follows new ones from last_move_id via the moves stream
+    state = room_states.get(room.room_code)
+    moves = list(state.moves)[-50:]
     
     context = {
         'room': room,
         'moves': moves,
+        'last_move_id': state.last_move_id,
         'is_player1': room.player1 == request.user if room.player1 else False,
         'is_player2': room.player2 == request.user if room.player2 else False,
         'is_current_turn': room.current_turn == request.user if room.current_turn else False,
     }
     return render(request, 'games/multiplayer_room.html', context)
 
+
+
+def get_player_match(request, match_id):
+    return get_object_or_404(
+        MultiplayerQuizMatch, Q(player1=request.user) | Q(player2=request.user), pk=match_id
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+def quiz_match_state(request, match_id):
+    """Current state of a quiz match for the requesting player (polled by the client)"""
+    data = match_engine.state_for(match_id, request.user.pk, get_language())
+    if data is None:
+        data = serialize_match(get_player_match(request, match_id), request.user.pk)
+    return JsonResponse(data)
+
+
+@login_required
+@require_http_methods(["POST"])
+def quiz_match_answer(request, match_id):
+    """Answer the current question of a quiz match"""
+    try:
+        answer_id = int(json.loads(request.body).get('answer_id'))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'A valid answer_id is required'}, status=400)
+    
+    try:
+        is_correct, data = match_engine.answer(match_id, request.user.pk, answer_id, get_language())
+    except QuizMatchError as e:
+        get_player_match(request, match_id)
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({'success': True, 'correct': is_correct, 'state': data})
+
+
+@login_required
+@require_http_methods(["POST"])
+def quiz_matchmaking_join(request):
+    """Join the matchmaking queue for a difficulty/category (blank for any)"""
+    try:
+        data = json.loads(request.body or '{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    difficulty = str(data.get('difficulty') or '')
+    category = str(data.get('category') or '').strip()[:100]
+    if difficulty and difficulty not in dict(QuizQuestion.DIFFICULTY_CHOICES):
+        return JsonResponse({'error': 'Unknown difficulty'}, status=400)
+    
+    match = matchmaking_queue.join(request.user, difficulty, category)
+    return JsonResponse(serialize_match(match, request.user.pk))
+
+
+@login_required
+@require_http_methods(["GET"])
+def quiz_matchmaking_wait(request, match_id):
+    """Long-poll until the player's searching match is paired (or cancelled)"""
+    def fetch():
+        return get_player_match(request, match_id)
+    
+    # A pairing made by another worker process does not wake us, so the row is also re-checked
+    match = wait_for(
+        quiz_match_channel(match_id), fetch, parse_poll_timeout(request, 'GAMES_LONG_POLL_TIMEOUT'),
+        ready=lambda match: match.status != 'searching',
+        interval=getattr(settings, 'GAMES_MATCHMAKING_RECHECK', 1),
+    )
+    return JsonResponse(serialize_match(match, request.user.pk))
+
+
+@login_required
+@require_http_methods(["POST"])
+def quiz_matchmaking_cancel(request):
+    """Leave the matchmaking queue"""
+    matchmaking_queue.cancel(request.user)
+    return JsonResponse({'success': True})
+
+
+@login_required
+@require_http_methods(["POST"])
+def start_multiplayer_room(request, room_code):
+    """Start a room's game once both players are in; player1 moves first"""
+    from django.utils import timezone
+    
+    # A single conditional UPDATE, so repeated or concurrent starts apply once
+    started = MultiplayerGameRoom.objects.filter(
+        Q(player1=request.user) | Q(player2=request.user),
+        room_code=room_code, player1__isnull=False, player2__isnull=False,
+    ).transition('ready', 'active', started_at=timezone.now(), current_turn=F('player1'))
+    
+    if started:
+        room_states.discard(room_code)
+    else:
+        messages.error(request, 'The game cannot be started yet!')
+    return redirect('games:multiplayer_room', room_code=room_code)
+
+
+def get_room_state_for_member(request, room_code):
+    """Room state if the requester belongs to the room, else an error response"""
+    state = room_states.get(room_code, request.user.pk)
+    if state is None:
+        return None, JsonResponse({'error': 'Room not found'}, status=404)
+    if request.user.pk not in state.member_ids:
+        return None, JsonResponse({'error': 'Access denied'}, status=403)
+    return state, None
+
+
+@login_required
+@require_http_methods(["POST"])
+def multiplayer_room_move(request, room_code):
+    """Submit a move in a multiplayer room"""
+    state, error = get_room_state_for_member(request, room_code)
+    if error:
+        return error
+    
+    try:
+        data = json.loads(request.body)
+        move_type = str(data['move_type']).strip()[:50]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'move_type is required'}, status=400)
+    if not move_type:
+        return JsonResponse({'error': 'move_type is required'}, status=400)
+    
+    try:
+        move = state.apply_move(request.user, move_type, data.get('move_data', {}))
+    except RoomMoveError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    
+    return JsonResponse({'success': True, 'move': move})
+
+
+@login_required
+@require_http_methods(["GET"])
+def multiplayer_room_moves(request, room_code):
+    """Long-poll for moves after the ``after`` cursor (a move id) in a multiplayer room"""
+    try:
+        after_id = max(int(request.GET.get('after', 0)), 0)
+    except (TypeError, ValueError):
+        after_id = 0
+    
+    def fetch():
+        # The room may be reloaded (e.g. the game started) while we wait
+        state, error = get_room_state_for_member(request, room_code)
+        return state, error, state.moves_after(after_id) if state else []
+    
+    state, error, moves = wait_for(
+        room_channel(room_code), fetch, parse_poll_timeout(request, 'GAMES_LONG_POLL_TIMEOUT'),
+        ready=lambda result: result[1] or result[2],
+    )
+    if error:
+        return error
+    return JsonResponse(state.serialize(moves))
@@ -2,6 +2,9 @@
 ASGI config for legal_lab project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server (e.g. ``uvicorn legal_lab.asgi:application``) so the
+async chat room views (``chat.views.chat_room_send`` / ``chat_room_stream``)
+can hold many open conversations in a single worker process.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
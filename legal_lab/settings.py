@@ -73,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'legal_lab.wsgi.application'
+ASGI_APPLICATION = 'legal_lab.asgi.application'
 
 
 # Database
@@ -86,6 +87,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Per-process memory cache; point this at a shared backend (Redis/Memcached) when
+# running several workers so chat presence, rate limits and game/quiz content versions
+# are shared (otherwise edited games and quiz questions reach other workers only when
+# their version expires, see GAMES_CONTENT_VERSION_TTL).
+# Rate-limit buckets get their own cache so a flood of visitors cannot cull other entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'legal-lab',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'legal-lab-ratelimit',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -150,6 +173,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
+# Online chat
+# Longest time (seconds) a long-poll request waits for new messages
+CHAT_LONG_POLL_TIMEOUT = 25
+# Admins without a heartbeat for this many seconds are shown as offline
+CHAT_PRESENCE_TIMEOUT = 300
+# Minimum seconds between AdminOnlineStatus writes for the same admin
+CHAT_PRESENCE_FLUSH_INTERVAL = 60
+# Seconds the shared "any admin online" flag is served from the cache
+CHAT_PRESENCE_CACHE_TTL = 10
+# Pub/sub layer fanning out ChatRoom messages to open streams (swap for a shared backend
+# when running several ASGI processes)
+CHAT_PUBSUB_BACKEND = 'chat.pubsub.InMemoryPubSub'
+# Seconds between keep-alive comments / before a room stream is recycled
+CHAT_STREAM_KEEPALIVE = 15
+CHAT_STREAM_MAX_AGE = 300
+# Token buckets for the anonymous widget endpoints: scope -> (tokens per second, burst)
+CHAT_RATE_LIMITS = {
+    'online_chat_send': (0.5, 5),
+    'online_chat_poll': (2, 30),
+}
+CHAT_RATE_LIMIT_CACHE = 'ratelimit'
+
+# Games
+# Sorted structure behind the in-memory leaderboard, and seconds between reloads from
+# the database (which is how other worker processes' updates are picked up)
+GAMES_LEADERBOARD_BACKEND = 'games.leaderboard.SortedListBackend'
+GAMES_LEADERBOARD_REFRESH = 60
+# Longest a games long-poll request (matchmaking, rooms) is held open, in seconds
+GAMES_LONG_POLL_TIMEOUT = 25
+# Seconds between re-checks of a waiting matchmaking row, which is how pairings made by
+# other worker processes are noticed (the notification hub only wakes this process)
+GAMES_MATCHMAKING_RECHECK = 1
+# Room code sequence numbers reserved from the database at a time
+GAMES_ROOM_CODE_BLOCK = 100
+# Seconds before a multiplayer room's in-memory state is reloaded from the database
+# (picks up moves and changes made on other workers), and how many rooms are kept
+GAMES_ROOM_STATE_TTL = 30
+GAMES_ROOM_STATES_MAX = 1000
+# Seconds a cached game content or quiz pool version lives; bounds how long a worker
+# that does not share the cache keeps serving content edited in another one
+GAMES_CONTENT_VERSION_TTL = 60
+
 # Login URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/accounts/dashboard/'
@@ -0,0 +1,285 @@
+/*
+ * Online chat widget.
+ *
+ * Loaded on demand by the bootstrap snippet in templates/chat/widget.html,
+ * either when the visitor opens the widget or when the browser remembers an
+ * ongoing conversation. URLs and translated strings come from data-*
+ * attributes on #chatWidget.
+ */
+(function () {
+    const CHAT_ACTIVE_KEY = 'legalLabChatActive';
+    const CHAT_SEEN_KEY = 'legalLabChatSeenId';
+
+    const widget = document.getElementById('chatWidget');
+    const config = widget.dataset;
+
+    let chatSessionId = null;
+    let lastMessageId = 0;
+    let messagePollController = null;
+    let bootstrapped = null;
+
+    function bootstrap() {
+        // Sets the CSRF cookie and tells us whether a conversation exists
+        if (!bootstrapped) {
+            const seenId = parseInt(localStorage.getItem(CHAT_SEEN_KEY), 10) || 0;
+            bootstrapped = fetch(`${config.bootstrapUrl}?seen_id=${seenId}`, {
+                method: 'GET',
+                credentials: 'same-origin',
+                cache: 'no-store'
+            })
+            .then(response => response.json())
+            .then(data => {
+                chatSessionId = data.session_id;
+                if (chatSessionId) {
+                    localStorage.setItem(CHAT_ACTIVE_KEY, '1');
+                } else {
+                    localStorage.removeItem(CHAT_ACTIVE_KEY);
+                }
+                updateAdminStatus(data.admin_online);
+                return data;
+            })
+            .catch(error => {
+                bootstrapped = null;
+                console.error('Error initializing chat:', error);
+                throw error;
+            });
+        }
+        return bootstrapped;
+    }
+
+    function toggle() {
+        if (widget.classList.contains('active')) {
+            close();
+        } else {
+            open();
+        }
+    }
+
+    function open() {
+        const btn = document.getElementById('floatingChatBtn');
+
+        widget.classList.add('active');
+        btn.style.display = 'none';
+        setBadge(0);
+
+        // Initialize chat session (starts polling once a session exists)
+        bootstrap().then(() => {
+            if (chatSessionId) {
+                loadMessages();
+            }
+        });
+    }
+
+    function close() {
+        const btn = document.getElementById('floatingChatBtn');
+
+        widget.classList.remove('active');
+        btn.style.display = 'flex';
+
+        // Stop polling
+        stopMessagePolling();
+    }
+
+    function resume() {
+        // A conversation is in progress: only show how many replies are waiting
+        bootstrap().then(data => setBadge(data.unread || 0));
+    }
+
+    function setBadge(count) {
+        const badge = document.getElementById('chatBadge');
+        badge.textContent = count;
+        badge.style.display = count ? 'flex' : 'none';
+    }
+
+    function loadMessages() {
+        // Only ask for messages newer than the last one we rendered; an
+        // unchanged conversation is answered with 304 from the ETag.
+        fetch(`${config.apiUrl}?after_id=${lastMessageId}`, {
+            method: 'GET',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            credentials: 'same-origin',
+            cache: 'no-cache'
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.session_id) {
+                chatSessionId = data.session_id;
+            }
+            appendMessages(data.messages);
+            updateAdminStatus(data.admin_online);
+
+            if (chatSessionId && widget.classList.contains('active')) {
+                startMessagePolling();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading messages:', error);
+        });
+    }
+
+    function appendMessages(messages) {
+        const container = document.getElementById('chatMessages');
+        const welcome = container.querySelector('.chat-welcome');
+
+        // Skip anything already rendered (e.g. a cached response replayed)
+        messages = messages.filter(msg => msg.id > lastMessageId);
+        if (messages.length === 0) return;
+
+        if (welcome) {
+            welcome.remove();
+        }
+
+        // Add messages
+        messages.forEach(msg => {
+            const messageDiv = document.createElement('div');
+            messageDiv.className = `chat-message ${msg.sender_type}`;
+
+            const bubble = document.createElement('div');
+            bubble.className = `message-bubble ${msg.sender_type}`;
+            bubble.textContent = msg.message;
+
+            const time = document.createElement('div');
+            time.className = 'message-time';
+            time.textContent = formatTime(msg.created_at);
+
+            messageDiv.appendChild(bubble);
+            messageDiv.appendChild(time);
+            container.appendChild(messageDiv);
+            lastMessageId = msg.id;
+        });
+        localStorage.setItem(CHAT_SEEN_KEY, lastMessageId);
+
+        // Scroll to bottom
+        container.scrollTop = container.scrollHeight;
+    }
+
+    function send() {
+        const input = document.getElementById('chatMessageInput');
+        const message = input.value.trim();
+
+        if (!message) return;
+
+        // Clear input
+        input.value = '';
+
+        // Send message (after bootstrap, so the CSRF cookie is set)
+        bootstrap()
+        .then(() => fetch(config.apiUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            credentials: 'same-origin',
+            body: JSON.stringify({
+                message: message
+            })
+        }))
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                localStorage.setItem(CHAT_ACTIVE_KEY, '1');
+                loadMessages(); // Fetch the sent message
+            }
+        })
+        .catch(error => {
+            console.error('Error sending message:', error);
+        });
+    }
+
+    function startMessagePolling() {
+        if (messagePollController) return;
+
+        messagePollController = new AbortController();
+        waitForMessages(messagePollController);
+    }
+
+    function stopMessagePolling() {
+        if (messagePollController) {
+            messagePollController.abort();
+            messagePollController = null;
+        }
+    }
+
+    function waitForMessages(controller) {
+        // Long-poll: the server holds the request until a message arrives
+        fetch(`${config.waitUrl}?after_id=${lastMessageId}`, {
+            method: 'GET',
+            credentials: 'same-origin',
+            cache: 'no-store',
+            signal: controller.signal
+        })
+        .then(response => response.json())
+        .then(data => {
+            appendMessages(data.messages);
+            updateAdminStatus(data.admin_online);
+
+            if (!data.session_id) {
+                stopMessagePolling();
+            } else if (!controller.signal.aborted) {
+                waitForMessages(controller);
+            }
+        })
+        .catch(error => {
+            if (controller.signal.aborted) return;
+            console.error('Error waiting for messages:', error);
+
+            // Back off before reconnecting
+            setTimeout(() => {
+                if (!controller.signal.aborted) {
+                    waitForMessages(controller);
+                }
+            }, 2000);
+        });
+    }
+
+    function updateAdminStatus(isOnline) {
+        const indicator = document.getElementById('adminStatusIndicator');
+        const statusText = document.getElementById('adminStatusText');
+
+        if (isOnline) {
+            indicator.className = 'status-indicator online';
+            statusText.textContent = config.textOnline;
+        } else {
+            indicator.className = 'status-indicator offline';
+            statusText.textContent = config.textOffline;
+        }
+    }
+
+    function formatTime(timeString) {
+        const date = new Date(timeString);
+        const now = new Date();
+        const diff = now - date;
+        const minutes = Math.floor(diff / 60000);
+
+        if (minutes < 1) return config.textJustNow;
+        if (minutes < 60) return `${minutes} ${config.textMinAgo}`;
+
+        return date.toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
+    }
+
+    function getCookie(name) {
+        let cookieValue = null;
+        if (document.cookie && document.cookie !== '') {
+            const cookies = document.cookie.split(';');
+            for (let i = 0; i < cookies.length; i++) {
+                const cookie = cookies[i].trim();
+                if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                    cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                    break;
+                }
+            }
+        }
+        return cookieValue;
+    }
+
+    window.ChatWidget = {
+        toggle: toggle,
+        open: open,
+        close: close,
+        send: send,
+        resume: resume,
+    };
+})();